@@ -1,21 +1,31 @@
 ﻿import requests
 import os
 import base64
+import io
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox, simpledialog, Menu, ttk
 from pathlib import Path
 from urllib.parse import quote_plus
 from PIL import Image
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 from datetime import datetime
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from matplotlib.widgets import LassoSelector
 from matplotlib.path import Path as MplPath
+from matplotlib.lines import Line2D
 import re
 import random
+import bisect
+import functools
+import struct
+import tempfile
+import zlib
+from collections import deque, OrderedDict
 from matplotlib import font_manager
 
 # 加载 .env 文件
@@ -85,15 +95,77 @@ def get_access_token(use_basic=False, use_general=False):
     return str(requests.post(url, params=params).json().get("access_token"))
 
 
+# 各识别接口的图片文件大小上限（MB）与发送前的最大边长（超过会被缩小）
+OCR_MAX_FILE_SIZE_MB = {'accurate': 3.8, 'basic': 3.5, 'general': 3.0}
+OCR_MAX_IMAGE_SIDE = {'accurate': 8192, 'basic': 8100, 'general': 4096}
+
+
+class MemoryImage:
+    """内存中已编码的图片（如拼接结果），可直接作为识别来源，无需写入临时文件"""
+    def __init__(self, data, name='内存图片', size=None):
+        self.data = data
+        self.name = name
+        self._size = size
+
+    @classmethod
+    def encode(cls, image, name, max_file_size_mb, qualities=(90, 85, 80, 70, 60, 50)):
+        """编码为 JPEG：从高到低尝试质量，取第一个不超过目标识别模式文件大小上限的结果（通常第一档即可）"""
+        # JPEG 不支持透明通道和调色板（RGBA、LA、P 等），先转为 RGB
+        if isinstance(image, Image.Image) and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for quality in qualities:
+            buf = io.BytesIO()
+            image.save(buf, format='JPEG', quality=quality)
+            if buf.tell() <= max_file_size_mb * 1024 * 1024:
+                break
+        return cls(buf.getvalue(), name, image.size)
+
+    @property
+    def size(self):
+        if self._size is None:
+            with self.open() as img:
+                self._size = img.size
+        return self._size
+
+    def open(self):
+        return Image.open(io.BytesIO(self.data))
+
+
+def open_ocr_source(source):
+    """打开识别来源（文件路径或 MemoryImage）"""
+    return source.open() if isinstance(source, MemoryImage) else Image.open(source)
+
+
+def ocr_source_name(source):
+    """识别来源的显示名称"""
+    return source.name if isinstance(source, MemoryImage) else os.path.basename(source)
+
+
+def read_ocr_source(source):
+    """识别来源的原始编码字节"""
+    if isinstance(source, MemoryImage):
+        return source.data
+    with open(source, "rb") as f:
+        return f.read()
+
+
 def get_file_content_as_base64(path, max_size=8192, max_file_size_mb=3.5):
-    """将图片文件转换为 base64 编码，自动压缩大图片和大文件"""
+    """将图片转换为 base64 编码，自动压缩大图片和大文件
+
+    path 可以是文件路径、MemoryImage、编码后的字节或 PIL 图片；内存来源符合限制时直接使用已编码的数据。
+    """
     try:
+        if isinstance(path, Image.Image):
+            path = MemoryImage.encode(path, '内存图片', max_file_size_mb)
+        elif isinstance(path, (bytes, bytearray)):
+            path = MemoryImage(bytes(path))
+        
         # 检查原始文件大小
-        file_size = os.path.getsize(path)
+        file_size = len(path.data) if isinstance(path, MemoryImage) else os.path.getsize(path)
         file_size_mb = file_size / (1024 * 1024)
         
         # 打开图片
-        img = Image.open(path)
+        img = open_ocr_source(path)
         width, height = img.size
         
         # 判断是否需要压缩（尺寸过大或文件过大）
@@ -119,7 +191,6 @@ def get_file_content_as_base64(path, max_size=8192, max_file_size_mb=3.5):
                 print(f"尺寸压缩: {width}x{height} → {new_width}x{new_height}")
             
             # 转换为字节流并调整质量
-            import io
             img_byte_arr = io.BytesIO()
             
             # 根据文件大小动态调整质量
@@ -152,15 +223,13 @@ def get_file_content_as_base64(path, max_size=8192, max_file_size_mb=3.5):
         else:
             # 图片尺寸和文件大小都合适，直接读取
             print(f"图片无需压缩: 尺寸({width}x{height}) 文件大小({file_size_mb:.1f}MB)")
-            with open(path, "rb") as f:
-                return base64.b64encode(f.read()).decode("utf8")
+            return base64.b64encode(read_ocr_source(path)).decode("utf8")
     
     except Exception as e:
         print(f"处理图片时出错: {e}")
         # 如果出错，尝试使用原始方法
         try:
-            with open(path, "rb") as f:
-                return base64.b64encode(f.read()).decode("utf8")
+            return base64.b64encode(read_ocr_source(path)).decode("utf8")
         except:
             return None
 
@@ -170,7 +239,8 @@ def ocr_image(image_path):
     url = "https://aip.baidubce.com/rest/2.0/ocr/v1/accurate?access_token=" + get_access_token()
     
     # 高精度识别使用较宽松的文件大小限制
-    image_base64 = get_file_content_as_base64(image_path, max_size=8192, max_file_size_mb=3.8)
+    image_base64 = get_file_content_as_base64(image_path, max_size=OCR_MAX_IMAGE_SIDE['accurate'],
+                                              max_file_size_mb=OCR_MAX_FILE_SIZE_MB['accurate'])
     
     if image_base64 is None:
         return {"error_msg": "图片处理失败", "error_code": -1}
@@ -200,7 +270,8 @@ def ocr_image_basic(image_path):
     url = "https://aip.baidubce.com/rest/2.0/ocr/v1/accurate_basic?access_token=" + get_access_token(use_basic=True)
     
     # 快速识别使用中等的文件大小限制
-    image_base64 = get_file_content_as_base64(image_path, max_size=8100, max_file_size_mb=3.5)
+    image_base64 = get_file_content_as_base64(image_path, max_size=OCR_MAX_IMAGE_SIDE['basic'],
+                                              max_file_size_mb=OCR_MAX_FILE_SIZE_MB['basic'])
     
     if image_base64 is None:
         return {"error_msg": "图片处理失败", "error_code": -1}
@@ -230,7 +301,8 @@ def ocr_image_general(image_path):
     url = "https://aip.baidubce.com/rest/2.0/ocr/v1/general?access_token=" + get_access_token(use_general=True)
     
     # 通用识别使用较严格的文件大小限制
-    image_base64 = get_file_content_as_base64(image_path, max_size=4096, max_file_size_mb=3.0)
+    image_base64 = get_file_content_as_base64(image_path, max_size=OCR_MAX_IMAGE_SIDE['general'],
+                                              max_file_size_mb=OCR_MAX_FILE_SIZE_MB['general'])
     
     if image_base64 is None:
         return {"error_msg": "图片处理失败", "error_code": -1}
@@ -256,6 +328,507 @@ def ocr_image_general(image_path):
 
 
 
+# 识别模式对应的接口函数
+OCR_FUNCTIONS = {'accurate': ocr_image, 'basic': ocr_image_basic, 'general': ocr_image_general}
+
+
+def format_ocr_lines(mode, words_result):
+    """把识别结果整理为输出行：快速识别只有文字，其余模式为 文字|top|left|height"""
+    if mode == 'basic':
+        return [item["words"] for item in words_result]
+    lines = []
+    for item in words_result:
+        location = item.get("location", {})
+        lines.append(f"{item['words']}|{location.get('top', 0)}|{location.get('left', 0)}|{location.get('height', 0)}")
+    return lines
+
+
+def _ink_mask(img, max_side):
+    """缩小图片后标出墨迹像素，返回 (墨迹布尔矩阵, 缩小倍数)"""
+    if img.mode not in ('L', 'RGB', 'RGBA'):
+        img = img.convert('RGB')
+    factor = max(1, int(np.ceil(max(img.size) / max_side)))
+    small = (img.reduce(factor) if factor > 1 else img).convert('L')
+    arr = np.asarray(small, dtype=np.int16)
+    # 以较亮的像素作为纸张底色，明显更暗的视为墨迹
+    return arr < np.percentile(arr, 90) - 48, factor
+
+
+def content_bbox(img, max_side=1024, pad=8):
+    """在缩小图上用行/列投影剖面检测内容区域，返回原图坐标的 (x1, y1, x2, y2)；找不到内容时返回 None"""
+    w, h = img.size
+    ink, factor = _ink_mask(img, max_side)
+    # 每行/列墨迹超过千分之二才算内容，忽略零星噪点
+    rows = np.flatnonzero(ink.sum(axis=1) > max(1, ink.shape[1] // 500))
+    cols = np.flatnonzero(ink.sum(axis=0) > max(1, ink.shape[0] // 500))
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+    sx, sy = w / ink.shape[1], h / ink.shape[0]
+    return (max(0, int(cols[0] * sx) - pad), max(0, int(rows[0] * sy) - pad),
+            min(w, int(np.ceil((cols[-1] + 1) * sx)) + pad), min(h, int(np.ceil((rows[-1] + 1) * sy)) + pad))
+
+
+def offset_ocr_locations(words_result, offset):
+    """把识别结果的 location 平移 offset，恢复为预处理（裁边、分块）前的原图坐标"""
+    dx, dy = offset
+    if dx or dy:
+        for item in words_result:
+            if 'location' in item:
+                item['location']['left'] = item['location'].get('left', 0) + dx
+                item['location']['top'] = item['location'].get('top', 0) + dy
+    return words_result
+
+
+def _whitespace_spans(profile, factor, length, max_len, min_len=0, overlap=48):
+    """沿一个方向切分：每刀落在允许范围内墨迹最少的空白带中间，返回相邻两段重叠 2*overlap 的 (起点, 终点) 列表"""
+    overlap = min(overlap, max_len // 8)
+    spans = []
+    start = 0
+    while length - start > max_len:
+        lo = start + min(max(min_len, max_len // 2), max_len - overlap)
+        hi = start + max_len - overlap
+        seg = profile[lo // factor:max(lo // factor + 1, hi // factor)]
+        cut = hi
+        if seg.size:
+            # 取最靠后的一段最少墨迹的连续行/列，在其中点下刀，让分块尽量大
+            low = np.flatnonzero(seg == seg.min())
+            first = len(low) - 1
+            while first > 0 and low[first - 1] == low[first] - 1:
+                first -= 1
+            cut = min(max(int(lo // factor + (low[first] + low[-1]) // 2) * factor + factor // 2, lo), hi)
+        spans.append((start, cut + overlap))
+        start = cut - overlap
+    # 最后一段太短时向前延伸到最小尺寸
+    spans.append((max(0, min(start, length - min_len)), length))
+    return spans
+
+
+def split_whitespace_tiles(img, max_width, max_height, min_width=0, min_height=0, overlap=48, max_side=2048):
+    """把超出尺寸上限的图片沿行/列投影剖面中的空白间隙切成互相重叠、各自满足尺寸限制的分块，返回原图坐标的 (x1, y1, x2, y2) 列表（逐行从左到右）"""
+    w, h = img.size
+    ink, factor = _ink_mask(img, max_side)
+    xs = _whitespace_spans(ink.sum(axis=0), factor, w, max_width, min_width, overlap)
+    ys = _whitespace_spans(ink.sum(axis=1), factor, h, max_height, min_height, overlap)
+    return [(x1, y1, x2, y2) for y1, y2 in ys for x1, x2 in xs]
+
+
+def _tile_territories(spans):
+    """每个分块在一个方向上的“领地”：以相邻分块重叠区的中线为界"""
+    spans = sorted(set(spans))
+    bounds = [float('-inf')] + [(b[0] + a[1]) / 2 for a, b in zip(spans, spans[1:])] + [float('inf')]
+    return {span: (bounds[i], bounds[i + 1]) for i, span in enumerate(spans)}
+
+
+def merge_tile_results(tiles, results):
+    """合并各分块的识别结果：location 平移回原图坐标，重叠区里重复识别的行只保留中心落在本块领地内的那份；
+    没有坐标（快速识别）时去掉与上一块末尾重复的开头几行"""
+    x_own = _tile_territories([(x1, x2) for x1, y1, x2, y2 in tiles])
+    y_own = _tile_territories([(y1, y2) for x1, y1, x2, y2 in tiles])
+    merged = []
+    for (x1, y1, x2, y2), words_result in zip(tiles, results):
+        offset_ocr_locations(words_result, (x1, y1))
+        (own_left, own_right), (own_top, own_bottom) = x_own[(x1, x2)], y_own[(y1, y2)]
+        kept = []
+        for item in words_result:
+            loc = item.get('location')
+            if loc is None:
+                kept.append(item)
+                continue
+            cx = loc.get('left', 0) + loc.get('width', 0) / 2
+            cy = loc.get('top', 0) + loc.get('height', 0) / 2
+            if own_left <= cx < own_right and own_top <= cy < own_bottom:
+                kept.append(item)
+        if kept and 'location' not in kept[0]:
+            repeat = min(len(merged), len(kept))
+            while repeat and [m['words'] for m in merged[-repeat:]] != [k['words'] for k in kept[:repeat]]:
+                repeat -= 1
+            kept = kept[repeat:]
+        merged.extend(kept)
+    return merged
+
+
+def right_to_left_layout(sizes, names=None):
+    """从右到左横向拼接的布局：第一张图在最右侧，各图垂直居中，返回每张来源图在拼接图中的位置"""
+    total_width = sum(w for w, h in sizes)
+    max_height = max(h for w, h in sizes)
+    sources = [None] * len(sizes)
+    x_offset = 0
+    for i in reversed(range(len(sizes))):
+        w, h = sizes[i]
+        sources[i] = {'index': i, 'name': names[i] if names else str(i + 1),
+                      'x': x_offset, 'y': (max_height - h) // 2, 'width': w, 'height': h}
+        x_offset += w
+    return {'direction': 'rtl', 'width': total_width, 'height': max_height, 'sources': sources}
+
+
+def _pack_shelves(sizes, items, max_width):
+    """FFDH 货架装箱：区域按高度降序放入第一个放得下的货架（行），都放不下时在下方新开一行"""
+    shelves = []
+    for i in sorted(items, key=lambda i: (-sizes[i][1], i)):
+        w, h = sizes[i]
+        shelf = next((sh for sh in shelves if sh['used'] + w <= max_width), None)
+        if shelf is None:
+            shelf = {'y': sum(sh['height'] for sh in shelves), 'height': h, 'used': 0, 'items': []}
+            shelves.append(shelf)
+        shelf['items'].append((i, shelf['used']))
+        shelf['used'] += w
+    return shelves
+
+
+def pack_merge_pages(sizes, max_width, max_height, min_width=0, min_height=0, names=None):
+    """把多个区域装进尽量少的合成图，每张合成图不超过 max_width x max_height
+
+    区域按原顺序依次加入当前合成图，页内用 FFDH 多行装箱，装不下时开新的合成图，
+    因此各合成图之间保持原有阅读顺序。返回的布局与 right_to_left_layout 格式相同，
+    sources 即区域在合成图中的位置映射表；行内从右到左排列，不足最小尺寸时补白边。
+    单个区域超出限制时独占一张合成图。
+    """
+    def fits(items):
+        shelves = _pack_shelves(sizes, items, max_width)
+        return (sum(sh['height'] for sh in shelves) <= max_height
+                and all(sh['used'] <= max_width for sh in shelves))
+
+    pages, current = [], []
+    for i in range(len(sizes)):
+        if current and not fits(current + [i]):
+            pages.append(current)
+            current = []
+        current.append(i)
+    if current:
+        pages.append(current)
+
+    layouts = []
+    for items in pages:
+        shelves = _pack_shelves(sizes, items, max_width)
+        width = max(max(sh['used'] for sh in shelves), min_width)
+        height = max(sum(sh['height'] for sh in shelves), min_height)
+        sources = []
+        for shelf in shelves:
+            for i, x in shelf['items']:
+                w, h = sizes[i]
+                sources.append({'index': i, 'name': names[i] if names else str(i + 1),
+                                'x': width - x - w, 'y': shelf['y'] + (shelf['height'] - h) // 2,
+                                'width': w, 'height': h})
+        sources.sort(key=lambda src: src['index'])
+        layouts.append({'direction': 'rtl', 'width': width, 'height': height, 'sources': sources})
+    return layouts
+
+
+def template_from_areas(boxes, size):
+    """把像素坐标的框选区域转换为相对坐标（0~1）的模板区域"""
+    w, h = size
+    return [[round(x1 / w, 6), round(y1 / h, 6), round(x2 / w, 6), round(y2 / h, 6)]
+            for x1, y1, x2, y2 in boxes]
+
+
+def template_to_boxes(regions, size):
+    """把模板的相对坐标换算为指定尺寸图片上的像素框"""
+    w, h = size
+    return [(int(round(x1 * w)), int(round(y1 * h)), int(round(x2 * w)), int(round(y2 * h)))
+            for x1, y1, x2, y2 in regions]
+
+
+def remap_ocr_locations(words_result, layout, boxes):
+    """把合成图上的识别结果按阅读顺序分回各区域，location 换算为区域所在原图的坐标
+
+    boxes 为各区域在原图中的像素框（下标与布局 sources 的 index 对应），返回 (区域序号, 识别项) 列表。
+    """
+    if not words_result:
+        return []
+    order, source, _, _ = reading_order(words_result, layout)
+    placed = {src['index']: src for src in layout['sources']}
+    mapped = []
+    for i in order:
+        src = placed[int(source[i])]
+        item = dict(words_result[i])
+        if 'location' in item:
+            x1, y1 = boxes[src['index']][:2]
+            location = dict(item['location'])
+            location['left'] = location.get('left', 0) - src['x'] + x1
+            location['top'] = location.get('top', 0) - src['y'] + y1
+            item['location'] = location
+        mapped.append((src['index'], item))
+    return mapped
+
+
+def _cluster_rank(values, min_gap, descending=False):
+    """一维间隙聚类，返回每个值所在簇的序号（按值升序或降序编号）"""
+    order = np.argsort(values, kind='stable')
+    breaks = np.concatenate([[0], (np.diff(values[order]) > min_gap).astype(int)])
+    ranks = np.empty(len(values), dtype=int)
+    ranks[order] = np.cumsum(breaks)
+    return ranks.max() - ranks if descending and len(ranks) else ranks
+
+
+def reading_order(words_result, layout=None):
+    """按阅读顺序排列OCR行，返回 (排序下标, 来源图序号, 栏序号, 是否竖排)
+
+    有拼接布局时按行中心点映射回所在（或最近）的来源区域；每张来源图内竖排文字按栏从右到左、栏内从上到下，
+    横排文字按行从上到下、行内从左到右，最后用一次 lexsort 得到整体顺序。
+    """
+    n = len(words_result)
+    if n == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=int), False
+    locations = [item.get('location', {}) for item in words_result]
+    top = np.array([loc.get('top', 0) for loc in locations], dtype=float)
+    left = np.array([loc.get('left', 0) for loc in locations], dtype=float)
+    width = np.array([loc.get('width', 0) for loc in locations], dtype=float)
+    height = np.array([loc.get('height', 0) for loc in locations], dtype=float)
+    cx, cy = left + width / 2, top + height / 2
+
+    source = np.zeros(n, dtype=int)
+    if layout and layout.get('sources'):
+        placed = layout['sources']
+        rects = np.array([[src['x'], src['y'], src['x'] + src['width'], src['y'] + src['height']]
+                          for src in placed], dtype=float)
+        # 中心点到各区域矩形的距离，落在矩形内为 0
+        dx = np.maximum(np.maximum(rects[:, 0] - cx[:, None], 0), cx[:, None] - rects[:, 2])
+        dy = np.maximum(np.maximum(rects[:, 1] - cy[:, None], 0), cy[:, None] - rects[:, 3])
+        source = np.array([src['index'] for src in placed])[np.argmin(dx * dx + dy * dy, axis=1)]
+
+    vertical = bool(np.median(height / np.maximum(width, 1)) > 1.5)
+    column = np.zeros(n, dtype=int)
+    for src in np.unique(source):
+        m = source == src
+        if vertical:
+            column[m] = _cluster_rank(cx[m], 0.5 * np.median(width[m]), descending=True)
+        else:
+            column[m] = _cluster_rank(cy[m], 0.5 * np.median(height[m]))
+    within = top if vertical else left
+    return np.lexsort((within, column, source)), source, column, vertical
+
+
+def image_size(path):
+    """只读取文件头获取图片尺寸，不解码像素"""
+    with Image.open(path) as img:
+        return img.size
+
+
+def decode_image(path):
+    """完整解码图片，统一为可显示、可粘贴的颜色模式"""
+    with Image.open(path) as img:
+        img.load()
+        return img if img.mode in ('RGB', 'RGBA', 'L') else img.convert('RGB')
+
+
+def write_png_strips(path, pixels, strip_rows=256):
+    """按行条带把 HxWxC 像素数组写成 RGB 的 PNG，内存中只保留一个条带（Sub 滤波 + 增量压缩）"""
+    height, width = pixels.shape[:2]
+
+    def write_chunk(f, tag, data):
+        f.write(struct.pack('>I', len(data)))
+        f.write(tag + data)
+        f.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        write_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        compressor = zlib.compressobj(6)
+        for y0 in range(0, height, strip_rows):
+            strip = np.ascontiguousarray(pixels[y0:y0 + strip_rows, :, :3]).reshape(-1, width * 3)
+            rows = np.empty((len(strip), width * 3 + 1), dtype=np.uint8)
+            rows[:, 0] = 1  # Sub 滤波：每个字节减去左侧像素的同一通道
+            rows[:, 1:4] = strip[:, :3]
+            rows[:, 4:] = strip[:, 3:] - strip[:, :-3]
+            data = compressor.compress(rows.tobytes())
+            if data:
+                write_chunk(f, b'IDAT', data)
+        write_chunk(f, b'IDAT', compressor.flush())
+        write_chunk(f, b'IEND', b'')
+
+
+class StripMergeCanvas:
+    """磁盘映射的拼接画布：来源图片逐张粘贴，保存时按条带读出，不在内存中分配整张拼接图"""
+    def __init__(self, width, height, strip_rows=256):
+        self.width, self.height = width, height
+        self.strip_rows = strip_rows
+        # 临时文件关闭即删除；RGBX 布局可直接交给 JPEG 编码器而无需复制
+        self.pixels = np.memmap(tempfile.TemporaryFile(), dtype=np.uint8, mode='w+',
+                                shape=(height, width, 4))
+        for y0 in range(0, height, strip_rows):
+            self.pixels[y0:y0 + strip_rows] = 255
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def paste(self, img, box):
+        x, y = box
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        self.pixels[y:y + img.height, x:x + img.width, :3] = np.asarray(img)
+
+    def save(self, path, format='JPEG', **params):
+        if format == 'PNG':
+            write_png_strips(path, self.pixels, self.strip_rows)
+        else:
+            Image.frombuffer('RGBX', self.size, self.pixels, 'raw', 'RGBX', 0, 1).save(path, format=format, **params)
+
+
+class DecodedImageCache:
+    """已解码图片的 LRU 缓存：按像素字节数计入内存预算，超出时淘汰最久未用的图片（可跨线程使用）"""
+    def __init__(self, budget_mb=512):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.entries = OrderedDict()
+        self.total = 0
+        self.lock = threading.RLock()  # 金字塔逐层生成时会在 loader 中递归调用 get
+
+    def get(self, key, loader, pin=False):
+        """取缓存的图片，没有时用 loader 解码；pin 的条目（缩略图）不会被淘汰，但同样计入预算"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+            img = loader()
+            nbytes = img.width * img.height * len(img.getbands())
+            self.entries[key] = (img, nbytes, pin)
+            self.total += nbytes
+            # 从最久未用的开始淘汰，跳过常驻条目，至少保留刚加载的这一张
+            for old_key in list(self.entries):
+                if self.total <= self.budget:
+                    break
+                if old_key == key or self.entries[old_key][2]:
+                    continue
+                self.total -= self.entries.pop(old_key)[1]
+            return img
+
+    def open(self, path):
+        """取原图（按需解码）"""
+        return self.get((path, 0), lambda: decode_image(path))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total = 0
+
+
+class ImagePyramid:
+    """图片的缩小金字塔：第 k 层为原图的 1/2^k，按需用 reduce(2) 逐层生成
+
+    所有层都放在共享的 DecodedImageCache 中计入内存预算：原图和较大的层按 LRU 淘汰，
+    不超过 keep_size 的小层作为缩略图常驻，直到缓存被清空。
+    """
+    def __init__(self, path, cache, size, min_size=256, keep_size=1024):
+        self.path = path
+        self.cache = cache
+        self.width, self.height = size
+        self.keep_size = keep_size
+        self.max_level = 0
+        w, h = size
+        while max(w, h) >= min_size * 2:
+            w, h = (w + 1) // 2, (h + 1) // 2
+            self.max_level += 1
+
+    def level(self, k):
+        k = min(max(k, 0), self.max_level)
+        # reduce(2) 向上取整，第 k 层的尺寸可以直接算出
+        pin = max(-(-self.width // 2 ** k), -(-self.height // 2 ** k)) <= self.keep_size
+        if k == 0:
+            return self.cache.get((self.path, 0), lambda: decode_image(self.path), pin)
+        return self.cache.get((self.path, k), lambda: self.level(k - 1).reduce(2), pin)
+
+    def level_for_scale(self, scale):
+        """返回不低于目标缩放的最小一层，从该层缩小即可得到清晰的显示效果"""
+        k = int(np.floor(np.log2(1.0 / scale))) if scale < 1.0 else 0
+        return self.level(k)
+
+    def render(self, box, size, resample=Image.Resampling.LANCZOS, scale=1.0):
+        """把原图坐标中的 box 区域渲染为 size 大小的图片"""
+        img = self.level_for_scale(scale)
+        sx, sy = img.width / self.width, img.height / self.height
+        x0, y0, x1, y1 = box
+        return img.resize(size, resample, box=(x0 * sx, y0 * sy, x1 * sx, y1 * sy))
+
+
+class TiledImageLayer:
+    """画布上的分块图片层：只渲染并上传当前视口内的图块，同一缩放下的图块缓存复用
+
+    交互过程中用更粗一层金字塔 + BILINEAR 快速生成预览图块，停止交互后由 refine_step 逐块替换为 LANCZOS 图块。
+    """
+    def __init__(self, canvas, pyramid, tag, tile_size=512):
+        self.canvas = canvas
+        self.pyramid = pyramid
+        self.tag = tag
+        self.tile_size = tile_size
+        self.scale = None
+        self.x_offset = 0
+        self.photos = {}
+        self.fine = {}
+        self.items = {}
+
+    def attach(self, scale, x_offset=0):
+        """画布清空后重新挂载；缩放变化时丢弃旧图块"""
+        if scale != self.scale:
+            self.photos.clear()
+            self.fine.clear()
+            self.scale = scale
+        self.x_offset = x_offset
+        self.items.clear()
+        return int(self.pyramid.width * scale), int(self.pyramid.height * scale)
+
+    def visible_tiles(self, margin=0):
+        canvas = self.canvas
+        view_w, view_h = canvas.winfo_width(), canvas.winfo_height()
+        vx0, vy0 = canvas.canvasx(0) - self.x_offset, canvas.canvasy(0)
+        disp_w = int(self.pyramid.width * self.scale)
+        disp_h = int(self.pyramid.height * self.scale)
+        t = self.tile_size
+        c0 = max(0, int(vx0 // t) - margin)
+        r0 = max(0, int(vy0 // t) - margin)
+        c1 = min((disp_w - 1) // t, int((vx0 + view_w) // t) + margin)
+        r1 = min((disp_h - 1) // t, int((vy0 + view_h) // t) + margin)
+        return [(c, r) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+    def _make_tile(self, c, r, preview=False):
+        from PIL import ImageTk
+        t, scale = self.tile_size, self.scale
+        disp_w = int(self.pyramid.width * scale)
+        disp_h = int(self.pyramid.height * scale)
+        x0, y0 = c * t, r * t
+        x1, y1 = min(x0 + t, disp_w), min(y0 + t, disp_h)
+        box = (x0 / scale, y0 / scale, x1 / scale, y1 / scale)
+        if preview:
+            tile = self.pyramid.render(box, (x1 - x0, y1 - y0), Image.Resampling.BILINEAR, scale / 2)
+        else:
+            tile = self.pyramid.render(box, (x1 - x0, y1 - y0), Image.Resampling.LANCZOS, scale)
+        return ImageTk.PhotoImage(tile)
+
+    def render(self, preview=False):
+        """补齐视口内缺失的图块，并回收视口外较远的图块"""
+        if self.scale is None:
+            return
+        visible = self.visible_tiles()
+        t = self.tile_size
+        for key in visible:
+            if key in self.items:
+                continue
+            if key not in self.photos:
+                self.photos[key] = self._make_tile(*key, preview)
+                self.fine[key] = not preview
+            c, r = key
+            self.items[key] = self.canvas.create_image(self.x_offset + c * t, r * t, anchor=tk.NW,
+                                                       image=self.photos[key], tags=self.tag)
+            self.canvas.tag_lower(self.items[key])
+        keep = set(self.visible_tiles(margin=1))
+        for key in [k for k in self.photos if k not in keep]:
+            del self.photos[key]
+            self.fine.pop(key, None)
+            if key in self.items:
+                self.canvas.delete(self.items.pop(key))
+
+    def refine_step(self):
+        """把视口内一个预览图块替换为高质量图块，返回是否替换了图块"""
+        if self.scale is None:
+            return False
+        for key in self.visible_tiles():
+            if key in self.items and not self.fine.get(key, True):
+                self.photos[key] = self._make_tile(*key)
+                self.fine[key] = True
+                self.canvas.itemconfigure(self.items[key], image=self.photos[key])
+                return True
+        return False
+
+
 class DataStore:
     """统一数据存储管理器"""
     def __init__(self, filepath):
@@ -335,6 +908,628 @@ class DataStore:
             print("✓ 数据迁移完成，已保存到 ocr_data.json")
 
 
+class FontStyleTrie:
+    """字体样式规则前缀树（忽略大小写，返回最长匹配的规则）"""
+    def __init__(self, rules=None):
+        self.root = {}
+        self.version = 0  # 每次重建加一，供缓存判断规则是否变化
+        self.rebuild(rules or {})
+
+    @staticmethod
+    def is_red_color(color):
+        """判断颜色是否为红色（支持多种红色表示）"""
+        color = (color or '#000000').upper()
+        return color in ['#FF0000', '#RED', 'RED'] or color.startswith('#FF')
+
+    def rebuild(self, rules):
+        """根据规则字典重新编译前缀树，每个规则预先计算好标签、组值和红色标志"""
+        self.root = {}
+        self.version += 1
+        for prefix, style in rules.items():
+            node = self.root
+            for ch in prefix.lower():
+                node = node.setdefault(ch, {})
+            # 大小写折叠后重复的前缀保留先出现的规则（与原先的遍历顺序一致）
+            if None in node:
+                continue
+            is_red = self.is_red_color(style.get('color', '#000000'))
+            node[None] = {
+                'prefix': prefix,
+                'tag': f"font_style_{prefix}",
+                'group': 'A' if is_red else 'B',
+                'is_red': is_red
+            }
+
+    def match(self, text):
+        """查找文本对应的最长前缀规则，没有匹配时返回 None"""
+        node = self.root
+        best = node.get(None)
+        for ch in str(text).lower():
+            node = node.get(ch)
+            if node is None:
+                break
+            best = node.get(None, best)
+        return best
+
+
+class TreeviewSync:
+    """分类目录树的增量同步模型：维护行 Uid 到节点 iid 的映射，只增删改移变化的节点"""
+    def __init__(self, tree):
+        self.tree = tree
+        self.iid_map = {}        # 行 Uid -> 数据项 iid
+        self.category_iids = {}  # 分类键 -> 分类目录 iid
+        self.category_keys = {}  # 分类目录 iid -> 分类键
+        self._rendered = {}      # iid -> 上次写入树中的 (text, values, tags)
+
+    @staticmethod
+    def row_iid(uid):
+        # 按 Uid 而非 DataFrame 位置索引生成，插入/删除行后其余行的 iid 不变
+        return f"row_{uid}"
+
+    @staticmethod
+    def category_iid(key):
+        return f"cat_{key}"
+
+    def category_key(self, iid):
+        """根据分类目录 iid 反查分类键"""
+        return self.category_keys.get(iid)
+
+    def clear(self):
+        """删除模型创建的所有节点"""
+        for iid in self.category_iids.values():
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+        for iid in self.iid_map.values():
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+        self.iid_map, self.category_iids, self.category_keys, self._rendered = {}, {}, {}, {}
+
+    def apply(self, categories):
+        """把目录树同步为 [(分类键, 目录文字, 目录标签, [(行Uid, values, tags), ...]), ...]"""
+        iid_map, category_iids = {}, {}
+        root_order = []
+        for key, text, tags, rows in categories:
+            pid = self.category_iid(key)
+            category_iids[key] = pid
+            root_order.append((pid, {'text': text, 'tags': tags, 'open': True}))
+        self._arrange("", root_order)
+
+        for key, text, tags, rows in categories:
+            pid = category_iids[key]
+            child_order = []
+            for uid, values, row_tags in rows:
+                iid = self.row_iid(uid)
+                iid_map[uid] = iid
+                child_order.append((iid, {'values': values, 'tags': row_tags}))
+            self._arrange(pid, child_order)
+
+        # 先删除过期的数据项，再删除过期的目录（已移到别处的子项不会被连带删除）
+        wanted = set(iid_map.values()) | set(category_iids.values())
+        stale = [iid for iid in self._rendered if iid not in wanted]
+        stale.sort(key=lambda iid: iid.startswith("cat_"))
+        for iid in stale:
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+            self._rendered.pop(iid, None)
+
+        self.iid_map, self.category_iids = iid_map, category_iids
+        self.category_keys = {iid: key for key, iid in category_iids.items()}
+
+    def _arrange(self, parent, desired):
+        """让 parent 的子节点按 desired 排列，只移动不在最长有序子序列中的节点"""
+        current = self.tree.get_children(parent)
+        position = {iid: i for i, iid in enumerate(current)}
+        present = [position[iid] for iid, _ in desired if iid in position]
+        stable = {current[p] for p in self._longest_increasing(present)}
+
+        # 先摘下其余子节点，此后 parent 下只剩按序排列的稳定节点：
+        # 处理到 desired 第 i 项时，前 i 个子节点恰好是 desired 的前 i 项，插入位置即 i，无需逐个向 Tk 查询
+        unstable = [iid for iid in current if iid not in stable]
+        if unstable:
+            self.tree.detach(*unstable)
+        for index, (iid, options) in enumerate(desired):
+            self._update(iid, options)
+            if iid not in stable:
+                if iid in self._rendered and self.tree.exists(iid):
+                    self.tree.move(iid, parent, index)
+                else:
+                    self.tree.insert(parent, index, iid=iid, **options)
+                self._rendered[iid] = (options.get('text'), options.get('values'), options.get('tags'))
+
+    def _update(self, iid, options):
+        """节点已存在且内容变化时才写回树"""
+        state = (options.get('text'), options.get('values'), options.get('tags'))
+        old = self._rendered.get(iid)
+        if old is None or old == state or not self.tree.exists(iid):
+            return
+        changes = {k: v for k, v in options.items() if k != 'open'}
+        self.tree.item(iid, **changes)
+        self._rendered[iid] = state
+
+    @staticmethod
+    def _longest_increasing(seq):
+        """返回严格递增的最长子序列（元素值）"""
+        tails, tail_idx, parent = [], [], [-1] * len(seq)
+        for i, value in enumerate(seq):
+            pos = bisect.bisect_left(tails, value)
+            if pos == len(tails):
+                tails.append(value)
+                tail_idx.append(i)
+            else:
+                tails[pos] = value
+                tail_idx[pos] = i
+            parent[i] = tail_idx[pos - 1] if pos > 0 else -1
+        result = []
+        i = tail_idx[-1] if tail_idx else -1
+        while i >= 0:
+            result.append(seq[i])
+            i = parent[i]
+        return result[::-1]
+
+
+class ScatterPlotRenderer:
+    """绘图交互区的持久化渲染器：散点只在数据变化时重建，标注按视图分级显示，阈值线作为动画层用 blit 增量刷新"""
+    def __init__(self, canvas, ax, max_labels=300, label_cell_px=(60, 16)):
+        self.canvas, self.ax = canvas, ax
+        self.scatter = None
+        self.label_pool = []       # 复用的标注对象，只显示视图内抽稀后的标注
+        self.max_labels = max_labels
+        self.label_cell_px = np.array(label_cell_px, dtype=float)  # 每个屏幕格子最多显示一个标注
+        self.labels = np.array([], dtype=object)
+        self.xy = np.empty((0, 2))
+        self.threshold_lines = {}  # 阈值 -> Line2D
+        self._data_hash = None
+        self._colors, self._sizes, self._marked = None, None, np.array([], dtype=bool)
+        self._background = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+        # 缩放、平移或改变窗口大小后重新布置标注
+        ax.callbacks.connect('xlim_changed', self._on_view_changed)
+        ax.callbacks.connect('ylim_changed', self._on_view_changed)
+        canvas.mpl_connect('resize_event', self._on_view_changed)
+
+    def _on_draw(self, event):
+        """完整重绘后缓存不含阈值线的背景，再把阈值线画到缓冲区"""
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.threshold_lines.values():
+            self.ax.draw_artist(line)
+
+    def _on_view_changed(self, *args):
+        self.layout_labels()
+
+    def set_points(self, df, colors, sizes, marked):
+        """更新散点与标注，返回是否需要完整重绘"""
+        data_hash = pd.util.hash_pandas_object(df[['Label', 'X', 'Y']], index=False).to_numpy()
+        if self._data_hash is None or not np.array_equal(data_hash, self._data_hash):
+            self._rebuild_points(df, colors, sizes, marked)
+            self._data_hash = data_hash
+            return True
+
+        changed = False
+        if colors != self._colors:
+            self.scatter.set_facecolors(colors)
+            changed = True
+        if not np.array_equal(sizes, self._sizes):
+            self.scatter.set_sizes(sizes)
+            changed = True
+        marks_changed = not np.array_equal(marked, self._marked)
+        self._colors, self._sizes, self._marked = colors, sizes, marked
+        # 标记点优先显示标注，标记变化后重新布置
+        if marks_changed:
+            self.layout_labels()
+            changed = True
+        return changed
+
+    def _rebuild_points(self, df, colors, sizes, marked):
+        """数据变化时重建散点，标注交给 layout_labels"""
+        if self.scatter is not None:
+            self.scatter.remove()
+            self.scatter = None
+        self._colors, self._sizes, self._marked = colors, sizes, np.asarray(marked, dtype=bool)
+        self.labels = df['Label'].astype(str).to_numpy(dtype=object)
+        self.xy = df[['X', 'Y']].to_numpy(dtype=float).reshape(-1, 2)
+        if not df.empty:
+            self.scatter = self.ax.scatter(self.xy[:, 0], self.xy[:, 1], c=colors, s=sizes, zorder=5)
+            # 视图范围只由数据点决定
+            self.ax.ignore_existing_data_limits = True
+            self.ax.update_datalim(self.xy)
+            self.ax.autoscale_view()
+        self.layout_labels()
+
+    def visible_label_positions(self):
+        """当前视图内需要显示标注的点：标记点优先，按屏幕格子抽稀并限制总数"""
+        if len(self.xy) == 0:
+            return np.array([], dtype=int)
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        xy = self.xy
+        visible = np.flatnonzero((xy[:, 0] >= x0) & (xy[:, 0] <= x1) & (xy[:, 1] >= y0) & (xy[:, 1] <= y1))
+        if len(visible) == 0:
+            return visible
+        visible = visible[np.argsort(~self._marked[visible], kind='stable')]
+        cells = np.floor(self.ax.transData.transform(xy[visible]) / self.label_cell_px).astype(np.int64)
+        _, first = np.unique(cells, axis=0, return_index=True)
+        return visible[np.sort(first)][:self.max_labels]
+
+    def layout_labels(self):
+        """把标注池分配给当前可见的点，多余的隐藏"""
+        chosen = self.visible_label_positions()
+        for k, pos in enumerate(chosen):
+            if k == len(self.label_pool):
+                self.label_pool.append(self.ax.annotate("", (0, 0), xytext=(0, 5), textcoords="offset points",
+                                                        ha='center', fontsize=9))
+            ann = self.label_pool[k]
+            ann.set_text(self.labels[pos])
+            ann.xy = (self.xy[pos, 0], self.xy[pos, 1])
+            self._style_annotation(ann, self._marked[pos])
+            ann.set_visible(True)
+        for ann in self.label_pool[len(chosen):]:
+            ann.set_visible(False)
+
+    @staticmethod
+    def _style_annotation(ann, marked):
+        ann.set_color('red' if marked else 'black')
+        ann.set_fontweight('bold' if marked else 'normal')
+
+    def set_thresholds(self, thresholds):
+        """逐条增删阈值线，返回是否有变化"""
+        wanted = set(thresholds)
+        changed = False
+        for y in list(self.threshold_lines):
+            if y not in wanted:
+                self.threshold_lines.pop(y).remove()
+                changed = True
+        for y in wanted:
+            if y not in self.threshold_lines:
+                line = Line2D([0, 1], [y, y], transform=self.ax.get_yaxis_transform(),
+                              color='blue', linestyle='--', alpha=0.5, animated=True)
+                self.ax.add_artist(line)
+                self.threshold_lines[y] = line
+                changed = True
+        return changed
+
+    def blit(self):
+        """恢复缓存背景并只重画阈值线"""
+        if self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        for line in self.threshold_lines.values():
+            self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
+
+
+class EditHistory:
+    """分类器编辑的撤销/重做栈：每步只保存编辑时记录的命令（按 Uid 定位的单元格、插删的行）和分类状态，栈深有上限"""
+    def __init__(self, limit=50):
+        self.undo_stack = deque(maxlen=limit)
+        self.redo_stack = deque(maxlen=limit)
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def record(self, label, ops, before_state, after_state):
+        """把一次编辑的命令入栈，没有任何变化时返回False"""
+        if not ops and before_state == after_state:
+            return False
+        self.undo_stack.append({'label': label, 'ops': list(ops), 'before': before_state, 'after': after_state})
+        self.redo_stack.clear()
+        return True
+
+    def undo(self, df):
+        """返回 (撤销后的表格, 撤销后的分类状态, 操作名)，栈空时返回None"""
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self.redo_stack.append(entry)
+        for op in reversed(entry['ops']):
+            df = self.apply_op(df, op, forward=False)
+        return df, entry['before'], entry['label']
+
+    def redo(self, df):
+        """返回 (重做后的表格, 重做后的分类状态, 操作名)，栈空时返回None"""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        for op in entry['ops']:
+            df = self.apply_op(df, op, forward=True)
+        return df, entry['after'], entry['label']
+
+    @staticmethod
+    def positions(df, uids):
+        """按 Uid 找到行的位置"""
+        return pd.Index(df['Uid']).get_indexer(uids)
+
+    @staticmethod
+    def insert_rows(df, positions, rows):
+        """把 rows 插入 df，使它们在结果中位于 positions（升序）"""
+        total = len(df) + len(rows)
+        slot = np.zeros(total, dtype=bool)
+        slot[positions] = True
+        take = np.empty(total, dtype=int)
+        take[~slot] = np.arange(len(df))
+        take[slot] = len(df) + np.arange(len(rows))
+        merged = pd.concat([df, rows[list(df.columns)]], ignore_index=True)
+        return merged.iloc[take].reset_index(drop=True)
+
+    @classmethod
+    def apply_op(cls, df, op, forward):
+        """把一条命令正向（重做）或反向（撤销）应用到当前表格
+        命令：('cells', 列, Uid, 旧值, 新值)、('column', 列, 旧列或None, 新列)、
+              ('insert', 位置, 行)、('delete', 位置, 行)、('permute', 新顺序对应的旧位置)"""
+        kind = op[0]
+        if kind == 'cells':
+            _, column, uids, old, new = op
+            df.iloc[cls.positions(df, uids), df.columns.get_loc(column)] = new if forward else old
+        elif kind == 'column':
+            _, column, old, new = op
+            values = new if forward else old
+            if values is None:
+                df = df.drop(columns=column)
+            else:
+                df[column] = values
+        elif kind in ('insert', 'delete'):
+            _, positions, rows = op
+            if (kind == 'insert') == forward:
+                df = cls.insert_rows(df, positions, rows)
+            else:
+                df = df.drop(df.index[cls.positions(df, rows['Uid'])]).reset_index(drop=True)
+        elif kind == 'permute':
+            perm = op[1]
+            df = df.iloc[perm if forward else np.argsort(perm)].reset_index(drop=True)
+        return df
+
+
+def save_classifier_session(path, df, state):
+    """把分类会话写成 npz：每列一个原生数组，其余状态放在 JSON 元数据中；先写临时文件再替换"""
+    path = Path(path)
+    arrays, null_columns = {}, []
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype == object:
+            if pd.api.types.infer_dtype(values, skipna=True) in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+                # 纯数字（空值本身就是NaN）可以无损转成数值数组
+                values = pd.to_numeric(df[col]).to_numpy()
+            else:
+                # 其余一律按文字保存，空值另存掩码，读取时还原为None，不会变成文字 'nan'
+                nulls = pd.isna(df[col]).to_numpy()
+                values = np.where(nulls, '', values).astype(str)
+                if nulls.any():
+                    arrays[f"null_{col}"] = nulls
+                    null_columns.append(col)
+        arrays[f"col_{col}"] = values
+    meta = {
+        'version': 1,
+        'columns': list(df.columns),
+        'null_columns': null_columns,
+        'thresholds': [float(t) for t in state['thresholds']],
+        'category_list': state['category_list'],
+        'marked_indices': sorted(int(i) for i in state['marked_indices']),
+        'custom_cat_names': state['custom_cat_names'],
+        'next_uid': int(state.get('next_uid', len(df))),
+        'saved_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    arrays['meta'] = np.array(json.dumps(meta, ensure_ascii=False))
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_classifier_session(path):
+    """读取 save_classifier_session 写出的会话，返回 (DataFrame, 元数据)"""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        df = pd.DataFrame({col: data[f"col_{col}"] for col in meta['columns']})
+        for col in meta.get('null_columns', []):
+            df[col] = df[col].astype(object).mask(data[f"null_{col}"], None)
+    return df, meta
+
+
+class ReportRenderer:
+    """文本报告的分段渲染：每个分类对应一段带标签的文字，按内容签名缓存，只替换变化的段"""
+    def __init__(self, text_widget):
+        self.text = text_widget
+        self.order = []      # 当前文本中各段的分类键顺序
+        self.rendered = {}   # 分类键 -> (签名, 段落文字)
+
+    @staticmethod
+    def render_section(title, rows, is_red):
+        """生成一个分类的报告文字：组值变化或红色文字相邻时插入空行"""
+        parts = [f"【{title}】:\n"]
+        prev_group, prev_is_red = None, None
+        for i, (name, group) in enumerate(rows):
+            red = is_red(name)
+            if i > 0 and ((prev_group is not None and prev_group != group) or (prev_is_red and red)):
+                parts.append("\n")
+            parts.append(f"{name}\n")
+            prev_group, prev_is_red = group, red
+        parts.append("\n")
+        return "".join(parts)
+
+    @staticmethod
+    def segment_tag(key):
+        return f"report_seg_{key}"
+
+    def update(self, sections, is_red, style_version):
+        """sections: [(分类键, 标题, [(名称, 组值), ...]), ...]；分类结构不变时只修补变化的段"""
+        new_rendered, changed = {}, []
+        for key, title, rows in sections:
+            signature = (title, tuple(rows), style_version)
+            old = self.rendered.get(key)
+            if old is not None and old[0] == signature:
+                new_rendered[key] = old
+            else:
+                new_rendered[key] = (signature, self.render_section(title, rows, is_red))
+                changed.append(key)
+        order = [key for key, _, _ in sections]
+
+        # 段顺序变化或标签已丢失（例如文本被整体替换）时整体重写
+        intact = order == self.order and all(self.text.tag_ranges(self.segment_tag(k)) for k in order)
+        if not intact:
+            self.text.delete("1.0", tk.END)
+            for key in order:
+                self.text.insert(tk.END, new_rendered[key][1], (self.segment_tag(key),))
+        else:
+            for key in changed:
+                self._replace_segment(key, new_rendered[key][1])
+        self.order, self.rendered = order, new_rendered
+
+    def update_section(self, key, title, rows, is_red, style_version):
+        """只重写一个分类段（段结构不变时使用）；该段不存在或标签已丢失时返回False"""
+        if key not in self.rendered or not self.text.tag_ranges(self.segment_tag(key)):
+            return False
+        signature = (title, tuple(rows), style_version)
+        if self.rendered[key][0] != signature:
+            self.rendered[key] = (signature, self.render_section(title, rows, is_red))
+            self._replace_segment(key, self.rendered[key][1])
+        return True
+
+    def _replace_segment(self, key, text):
+        """删除段标签覆盖的全部区间（用户编辑可能把它拆成多段）后在原起点写入新文字"""
+        tag = self.segment_tag(key)
+        ranges = self.text.tag_ranges(tag)
+        start = str(ranges[0])
+        # 从后往前删，前面区间的索引不受影响
+        for i in range(len(ranges) - 2, -1, -2):
+            self.text.delete(ranges[i], ranges[i + 1])
+        self.text.insert(start, text, (tag,))
+
+
+class PointGridIndex:
+    """散点的均匀网格索引：圈选时先按外接矩形取候选点，再做精确的多边形判断；坐标变化时惰性重建"""
+    def __init__(self, points_per_cell=8):
+        self.points_per_cell = points_per_cell
+        self.xy = None
+
+    def _build(self, xy):
+        self.xy = xy.copy()
+        n = len(xy)
+        self.grid = max(1, int(np.sqrt(n / self.points_per_cell)))
+        self.origin = xy.min(axis=0)
+        span = xy.max(axis=0) - self.origin
+        self.cell_size = np.where(span > 0, span / self.grid, 1.0)
+        cells = self._cell_coords(xy)
+        cell_ids = cells[:, 1] * self.grid + cells[:, 0]
+        # 按格子编号排序后，每个格子的点是 order 中连续的一段
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.starts = np.searchsorted(cell_ids[self.order], np.arange(self.grid * self.grid + 1))
+
+    def _cell_coords(self, xy):
+        cells = np.floor((xy - self.origin) / self.cell_size).astype(int)
+        return np.clip(cells, 0, self.grid - 1)
+
+    def query_bbox(self, xy, x0, y0, x1, y1):
+        """返回落在矩形内的点的位置数组"""
+        if len(xy) == 0:
+            return np.array([], dtype=int)
+        if self.xy is None or self.xy.shape != xy.shape or not np.array_equal(self.xy, xy):
+            self._build(xy)
+        (cx0, cy0), (cx1, cy1) = self._cell_coords(np.array([[x0, y0], [x1, y1]], dtype=float))
+        # 同一行格子的编号连续，对应 order 中的一个切片
+        slices = [self.order[self.starts[cy * self.grid + cx0]:self.starts[cy * self.grid + cx1 + 1]]
+                  for cy in range(cy0, cy1 + 1)]
+        candidates = np.concatenate(slices) if slices else np.array([], dtype=int)
+        pts = xy[candidates]
+        keep = (pts[:, 0] >= x0) & (pts[:, 0] <= x1) & (pts[:, 1] >= y0) & (pts[:, 1] <= y1)
+        return candidates[keep]
+
+    def contains(self, xy, verts):
+        """返回每个点是否在多边形内的布尔数组"""
+        inside = np.zeros(len(xy), dtype=bool)
+        verts = np.asarray(verts, dtype=float)
+        if len(xy) == 0 or len(verts) < 3:
+            return inside
+        (x0, y0), (x1, y1) = verts.min(axis=0), verts.max(axis=0)
+        candidates = self.query_bbox(xy, x0, y0, x1, y1)
+        if len(candidates):
+            inside[candidates] = MplPath(verts).contains_points(xy[candidates])
+        return inside
+
+
+def nearest_sorted(values, x):
+    """在升序列表中二分查找离 x 最近的值，列表为空时返回None"""
+    if not values:
+        return None
+    i = bisect.bisect_left(values, x)
+    if i == 0:
+        return values[0]
+    if i == len(values):
+        return values[-1]
+    return values[i] if values[i] - x < x - values[i - 1] else values[i - 1]
+
+
+def propose_row_thresholds(y_values, heights=None):
+    """按 Y 排序做间隙检测，在相邻两行之间的间隙中点放分界线（保留一位小数）
+
+    有行高时，间隙超过行高中位数一半即视为换行；没有行高时对间隙做一维二分类（k=2），
+    两类差别不明显则不给出建议。
+    """
+    y = np.sort(np.asarray(y_values, dtype=float))
+    y = y[np.isfinite(y)]
+    if len(y) < 2:
+        return []
+    gaps = np.diff(y)
+
+    h = np.asarray(heights, dtype=float) if heights is not None else np.array([])
+    h = h[np.isfinite(h) & (h > 0)]
+    if h.size:
+        min_gap = 0.5 * np.median(h)
+    else:
+        g = np.sort(gaps)
+        if len(g) < 2:
+            return []
+        # 一维 k=2 聚类：找使两类组内平方和最小的切分点
+        csum, csum2 = np.cumsum(g), np.cumsum(g * g)
+        k = np.arange(1, len(g))
+        left = csum2[:-1] - csum[:-1] ** 2 / k
+        right = (csum2[-1] - csum2[:-1]) - (csum[-1] - csum[:-1]) ** 2 / (len(g) - k)
+        split = int(np.argmin(left + right))
+        small_mean = csum[split] / (split + 1)
+        large_mean = (csum[-1] - csum[split]) / (len(g) - split - 1)
+        if large_mean < 2 * small_mean + 1e-9:
+            return []
+        min_gap = (g[split] + g[split + 1]) / 2
+
+    cut = gaps > min_gap
+    thresholds = np.round((y[:-1][cut] + y[1:][cut]) / 2, 1)
+    return sorted(set(thresholds.tolist()))
+
+
+def threshold_band_names(t_sorted):
+    """阈值线划分出的各分区名称，顺序与 np.searchsorted 得到的分区号一致"""
+    if not t_sorted:
+        return ["数据区"]
+    names = [f"低于 {t_sorted[0]}"]
+    names += [f"{t_sorted[i]} ~ {t_sorted[i + 1]}" for i in range(len(t_sorted) - 1)]
+    names.append(f"高于 {t_sorted[-1]}")
+    return names
+
+
+def assign_threshold_bands(y_values, t_sorted):
+    """一次 searchsorted 为每行计算分区号：Y 小于第一条线为0，等于阈值时归入上方分区"""
+    if not t_sorted:
+        return np.zeros(len(y_values), dtype=int)
+    return np.searchsorted(np.asarray(t_sorted, dtype=float), np.asarray(y_values, dtype=float), side='right')
+
+
+@functools.lru_cache(maxsize=8)
+def compile_space_rules(custom_chars):
+    """把“一时|二时”形式的规则编译成一个正则：匹配每对字符之间的插入点，没有有效规则时返回None（最近用过的几组规则有缓存）"""
+    tokens = [t.strip() for t in re.split(r'[|,\s，]+', custom_chars or '') if t.strip()]
+    # 按第二个字分组，同组的第一个字合并为字符集，减少分支数量
+    firsts_by_second = {}
+    for token in tokens:
+        if len(token) == 2:
+            firsts_by_second.setdefault(token[1], set()).add(token[0])
+    if not firsts_by_second:
+        return None
+    branches = [f"(?<=[{''.join(re.escape(c) for c in sorted(firsts))}])(?={re.escape(second)})"
+                for second, firsts in firsts_by_second.items()]
+    return re.compile("|".join(branches))
+
+
 class OCRApp:
     def __init__(self, root):
         self.root = root
@@ -360,6 +1555,9 @@ class OCRApp:
         # 统计数据
         self.stats = self.store.get('stats', {})
         
+        # 识别前自动裁掉空白边距（识别页功能区的开关要用到，需在建界面前读取）
+        self.auto_trim_enabled = self.store.get('auto_trim', False)
+        
         # 历史记录
         self.history_limit = self.store.get('history_limit', 100)
         self.history_data = self.store.get('history', [])
@@ -397,22 +1595,41 @@ class OCRApp:
         
         # 字体样式配置
         self.font_style_rules = {}  # 字体样式规则：{前缀: {样式配置}}
+        self.font_style_trie = FontStyleTrie()  # 规则编译后的前缀树，保存配置时重建
         self.load_font_style_config()  # 加载字体样式配置
-        self.df = pd.DataFrame(columns=['Label', 'Y', 'X', 'Group', 'Order'])
+        self.df = pd.DataFrame(columns=['Label', 'Y', 'X', 'Group', 'Order', 'Category', 'Uid', 'Height'])
+        self.next_uid = 0  # 下一个可用的行标识（撤销/重做按 Uid 对齐行）
+        self._uid_lookup = None  # (建表时的 self.df, Uid 索引)，目录树行按 Uid 反查DataFrame索引
+        self.history = EditHistory()
         self.thresholds = []
         self.category_list = []
+        self.next_category_id = 0  # 下一个可用的圈选分类标识（目录树按标识而非列表位置定位分类）
+        self.category_positions = {}  # 分类键 -> 在category_list中的位置
         self.marked_indices = set()
         self.custom_cat_names = {}
         self.drag_source_item = None
+        self.order_min_gap = 1e-6  # 拖拽排序时相邻Order间隔小于此值则重新编号
         self.enable_lasso_mode = tk.BooleanVar(value=False)
         self.color_cycle = ['#FF0000', '#00AA00', '#FF8C00', '#9400D3', '#0000FF', '#00CED1']
         self.lasso = None
+        self.point_index = PointGridIndex()  # 圈选用的散点网格索引
+        
+        # 分类会话（退出时保存，后台定时自动保存）
+        self.session_file = Path(__file__).parent / 'classifier_session.npz'
+        self.session_changes = 0        # 主线程每次改动分类数据时递增
+        self.session_saved_changes = 0  # 最近一次成功保存时的改动计数（后台线程保存成功后写入）
+        self.session_save_thread = None
+        self.session_autosave_ms = self.store.get('session_autosave_seconds', 60) * 1000
         
         # 创建主界面
         self.setup_main_interface()
         
         # 启用拖放功能
         self._setup_drag_drop()
+        
+        # 恢复上次的分类会话并启动自动保存
+        self.restore_last_session()
+        self.root.after(self.session_autosave_ms, self.autosave_session)
 
     def setup_main_interface(self):
         """设置主界面"""
@@ -457,11 +1674,15 @@ class OCRApp:
                                                          "#00BCD4", state=tk.DISABLED)
         self.general_ocr_btn = self._create_ribbon_button(ocr_group, "📄\n通用", self.perform_general_ocr, 
                                                            "#9C27B0", state=tk.DISABLED)
+        self.auto_trim_var = tk.BooleanVar(value=self.auto_trim_enabled)
+        tk.Checkbutton(ocr_group, text="✂️\n自动裁边", variable=self.auto_trim_var,
+                      command=self.toggle_auto_trim, bg="#f0f0f0", font=("Arial", 8)).pack(side=tk.LEFT, padx=2)
         
         # === 图片处理组 ===
         image_group = self._create_ribbon_group(ribbon_content, "图片处理")
         self.merge_btn = self._create_ribbon_button(image_group, "🖼️\n拼接", self.merge_images, "#FF9800")
         self.crop_merge_btn = self._create_ribbon_button(image_group, "✂️\n裁剪", self.crop_and_merge_direct, "#FF6F00")
+        self.template_batch_btn = self._create_ribbon_button(image_group, "📑\n模板批量", self.run_template_batch, "#E65100")
         
         # === 结果操作组 ===
         result_group = self._create_ribbon_group(ribbon_content, "结果操作")
@@ -521,6 +1742,8 @@ class OCRApp:
         self.result_text.bind("<Button-3>", self.show_context_menu)
         
         self.image_paths = []  # 存储多个图片路径
+        self.merge_layouts = {}  # 拼接图片（识别来源） -> 拼接布局（用于恢复阅读顺序）
+        self.image_cache = DecodedImageCache(self.store.get('image_cache_mb', 512))  # 裁剪窗口的已解码原图
         self.all_results = []  # 存储所有识别结果
 
     def setup_classifier_tab(self):
@@ -570,6 +1793,12 @@ class OCRApp:
         self.text_input.pack(fill=tk.X, pady=5)
         tk.Button(control_frame, text="📋 粘贴并解析数据", command=self.load_from_text, bg="#e1f5fe",
                   font=("", 10, "bold")).pack(fill=tk.X)
+        session_frame = tk.Frame(control_frame)
+        session_frame.pack(fill=tk.X, pady=(5, 0))
+        tk.Button(session_frame, text="💾 保存会话", command=self.save_session_as, bg="#e8f5e9").pack(
+            side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Button(session_frame, text="📂 打开会话", command=self.open_session, bg="#fff8e1").pack(
+            side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
 
         # 2. 交互模式
         mode_frame = tk.LabelFrame(self.left_panel, text="2. 绘图模式切换", padx=10, pady=10, fg="blue")
@@ -578,6 +1807,8 @@ class OCRApp:
                        command=self.update_plot_view).pack(anchor="w")
         tk.Radiobutton(mode_frame, text="🎯 圈选模式 (画圈提取数据)", variable=self.enable_lasso_mode, value=True,
                        command=self.update_plot_view).pack(anchor="w")
+        tk.Button(mode_frame, text="📏 自动分行", command=self.auto_detect_row_thresholds,
+                  bg="#e8eaf6").pack(fill=tk.X, pady=(5, 0))
 
         # 3. 操作
         op_frame = tk.LabelFrame(self.left_panel, text="3. 全局重置", padx=10, pady=10)
@@ -598,6 +1829,10 @@ class OCRApp:
                                                                                               pady=2)
         tk.Button(t_bar, text="❌ 删除", command=self.delete_selected_data, bg="#ffcccc").pack(side=tk.LEFT, padx=2,
                                                                                               pady=2)
+        self.undo_btn = tk.Button(t_bar, text="↶ 撤销", command=self.undo_edit, state=tk.DISABLED)
+        self.undo_btn.pack(side=tk.LEFT, padx=2)
+        self.redo_btn = tk.Button(t_bar, text="↷ 重做", command=self.redo_edit, state=tk.DISABLED)
+        self.redo_btn.pack(side=tk.LEFT, padx=2)
         tk.Label(t_bar, text="|").pack(side=tk.LEFT, padx=2)
         tk.Button(t_bar, text="↑ 上移", command=self.move_item_up).pack(side=tk.LEFT, padx=2)
         tk.Button(t_bar, text="↓ 下移", command=self.move_item_down).pack(side=tk.LEFT, padx=2)
@@ -626,6 +1861,7 @@ class OCRApp:
         self.tree.heading('Status', text='标记')
         self.tree.heading('Group', text='组')
         self.tree.column('Index', width=0, stretch=False)
+        self.tree_sync = TreeviewSync(self.tree)
         
         # 设置列宽度 - 确保红色文字能完全显示
         self.tree.column('#0', width=220, minwidth=150, stretch=True)  # 分类目录列，可拉伸
@@ -647,6 +1883,8 @@ class OCRApp:
         self.tree.bind("<Button-3>", self.on_right_click)
         self.tree.bind("<Double-1>", self.on_double_click)  # 添加双击事件
         self.tree.bind("<space>", self.split_group_a_items)  # 空格键拆分所有A组
+        self.tree.bind("<Control-z>", self.undo_edit)
+        self.tree.bind("<Control-y>", self.redo_edit)
 
         # --- 报告页 ---
         self.tab_report = tk.Frame(self.inner_nb)
@@ -665,18 +1903,24 @@ class OCRApp:
         self.report_text = scrolledtext.ScrolledText(self.tab_report, wrap=tk.WORD, 
                                                    font=("Microsoft YaHei", 11))
         self.report_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.report_renderer = ReportRenderer(self.report_text)
+        self.report_sections = []
 
     def setup_plot_tab(self):
         """定义绘图标签页内容"""
         self.fig, self.ax = plt.subplots(figsize=(6, 6), dpi=100)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.tab_plt)
         self.canvas.mpl_connect('button_press_event', self.on_plot_click)
+        self.ax.set_title("绘图交互区")
+        self.plot_renderer = ScatterPlotRenderer(self.canvas, self.ax)
 
         # 添加 matplotlib 工具栏
         toolbar = NavigationToolbar2Tk(self.canvas, self.tab_plt)
         toolbar.update()
 
         self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.canvas.get_tk_widget().bind("<Control-z>", self.undo_edit)
+        self.canvas.get_tk_widget().bind("<Control-y>", self.redo_edit)
 
     # ===============================================
     # 数据分类功能方法
@@ -686,8 +1930,11 @@ class OCRApp:
         try:
             if messagebox.askyesno("确认重置", "确定要按Y坐标重新排序吗？\n这将覆盖当前的手动调整顺序。"):
                 # 按Y坐标排序，然后重新分配Order值
-                self.df = self.df.sort_values('Y', ascending=False).reset_index(drop=True)  # Y坐标从大到小
-                self.df['Order'] = range(len(self.df))
+                edit = self.begin_edit()
+                # Y坐标从大到小
+                self.edit_permute_rows(edit, np.argsort(-self.df['Y'].to_numpy(dtype=float), kind='stable'))
+                self.edit_column(edit, 'Order', np.arange(len(self.df)))
+                self._commit_edit("按Y坐标重置顺序", edit)
                 
                 self.refresh_all()
                 self.show_temp_message("✓ 已按Y坐标重新排序！")
@@ -710,6 +1957,204 @@ class OCRApp:
         except Exception as e:
             messagebox.showerror("错误", f"保存顺序失败：{str(e)}")
 
+    # ===============================================
+    # 撤销/重做
+    # ===============================================
+    def new_uids(self, count):
+        """分配新的行标识"""
+        uids = np.arange(self.next_uid, self.next_uid + count)
+        self.next_uid += count
+        return uids
+
+    def _classifier_state(self):
+        """阈值、分类、标记和自定义名称的副本"""
+        return {'thresholds': list(self.thresholds),
+                'category_list': [dict(cat) for cat in self.category_list],
+                'marked_indices': set(self.marked_indices),
+                'custom_cat_names': dict(self.custom_cat_names)}
+
+    def begin_edit(self):
+        """开始一次可撤销的编辑：只记下分类状态，表格改动由 edit_* 方法逐条记成命令"""
+        return {'ops': [], 'before': self._classifier_state()}
+
+    def edit_cells(self, edit, rows, column, values):
+        """修改若干行（DataFrame索引或布尔掩码）的一列，并把这些单元格的新旧值记入编辑"""
+        rows = np.asarray(rows)
+        rows = self.df.index[rows] if rows.dtype == bool else pd.Index(np.atleast_1d(rows))
+        if column not in self.df.columns:
+            self.edit_column(edit, column, np.nan)
+        old = self.df.loc[rows, column].to_numpy(copy=True)
+        self.df.loc[rows, column] = values
+        if edit is not None:
+            edit['ops'].append(('cells', column, self.df.loc[rows, 'Uid'].to_numpy(copy=True),
+                                old, self.df.loc[rows, column].to_numpy(copy=True)))
+
+    def edit_column(self, edit, column, values):
+        """整列写入（建列、整体重新编号等本身就是整列的操作）"""
+        old = self.df[column].to_numpy(copy=True) if column in self.df.columns else None
+        self.df[column] = values
+        if edit is not None:
+            edit['ops'].append(('column', column, old, self.df[column].to_numpy(copy=True)))
+
+    def edit_insert_rows(self, edit, positions, rows):
+        """插入带 Uid 的行，使它们位于 positions（升序，插入后的位置）"""
+        positions = np.atleast_1d(np.asarray(positions, dtype=int))
+        rows = rows.reset_index(drop=True)
+        self.df = EditHistory.insert_rows(self.df, positions, rows)
+        if edit is not None:
+            edit['ops'].append(('insert', positions, rows))
+
+    def edit_delete_rows(self, edit, labels):
+        """删除若干行（DataFrame索引），被删的行连同原位置记入编辑"""
+        positions = np.sort(self.df.index.get_indexer(pd.Index(np.atleast_1d(labels))))
+        rows = self.df.iloc[positions].reset_index(drop=True)
+        self.df = self.df.drop(self.df.index[positions]).reset_index(drop=True)
+        if edit is not None:
+            edit['ops'].append(('delete', positions, rows))
+
+    def edit_permute_rows(self, edit, perm):
+        """按 perm（新顺序中每行原来的位置）重排表格"""
+        perm = np.asarray(perm, dtype=int)
+        self.df = self.df.iloc[perm].reset_index(drop=True)
+        if edit is not None:
+            edit['ops'].append(('permute', perm))
+
+    def _commit_edit(self, label, edit):
+        """把这次编辑记录的命令写入撤销栈"""
+        try:
+            self.history.record(label, edit['ops'], edit['before'], self._classifier_state())
+        except Exception as e:
+            print(f"⚠️ 记录撤销信息失败: {e}")
+        self.update_undo_buttons()
+
+    def update_undo_buttons(self):
+        """根据栈状态启用/禁用撤销重做按钮"""
+        if hasattr(self, 'undo_btn'):
+            self.undo_btn.config(state=tk.NORMAL if self.history.undo_stack else tk.DISABLED)
+            self.redo_btn.config(state=tk.NORMAL if self.history.redo_stack else tk.DISABLED)
+
+    def _restore_from_history(self, result, action):
+        if result is None:
+            return
+        self.df, state, label = result
+        self.thresholds = list(state['thresholds'])
+        self.category_list = [dict(cat) for cat in state['category_list']]
+        self.marked_indices = set(state['marked_indices'])
+        self.custom_cat_names = dict(state['custom_cat_names'])
+        self.update_undo_buttons()
+        self.refresh_all()
+        self.show_temp_message(f"✓ 已{action}：{label}")
+
+    def undo_edit(self, event=None):
+        """撤销上一步编辑"""
+        try:
+            self._restore_from_history(self.history.undo(self.df), "撤销")
+        except Exception as e:
+            messagebox.showerror("错误", f"撤销失败：{str(e)}")
+        if event:
+            return "break"
+
+    def redo_edit(self, event=None):
+        """重做上一步撤销的编辑"""
+        try:
+            self._restore_from_history(self.history.redo(self.df), "重做")
+        except Exception as e:
+            messagebox.showerror("错误", f"重做失败：{str(e)}")
+        if event:
+            return "break"
+
+    # ===============================================
+    # 分类会话保存/恢复
+    # ===============================================
+    def _session_state(self):
+        """当前分类状态加上行标识计数"""
+        state = self._classifier_state()
+        state['next_uid'] = self.next_uid
+        return state
+
+    def _apply_session(self, df, meta):
+        """用读取到的会话替换当前分类状态"""
+        self.df = df
+        if 'Uid' not in self.df.columns:
+            self.df['Uid'] = range(len(self.df))
+        self.next_uid = max(meta.get('next_uid', 0), int(self.df['Uid'].max()) + 1 if len(self.df) else 0)
+        self.thresholds = sorted(meta.get('thresholds', []))
+        self.category_list = meta.get('category_list', [])
+        self.assign_category_ids()
+        self.marked_indices = set(meta.get('marked_indices', []))
+        self.custom_cat_names = meta.get('custom_cat_names', {})
+        self.history.clear()
+        self.update_undo_buttons()
+        self.refresh_all()
+        self.session_saved_changes = self.session_changes
+
+    def restore_last_session(self):
+        """启动时恢复自动保存的分类会话"""
+        if not self.session_file.exists():
+            return
+        try:
+            df, meta = load_classifier_session(self.session_file)
+            self._apply_session(df, meta)
+            print(f"✓ 已恢复分类会话: {len(df)} 条数据（{meta.get('saved_at', '')}）")
+        except Exception as e:
+            print(f"⚠️ 恢复分类会话失败: {e}")
+
+    def mark_session_dirty(self):
+        """记录分类数据有新的改动，等待自动保存"""
+        self.session_changes += 1
+
+    def session_dirty(self):
+        """是否有尚未保存的改动"""
+        return self.session_changes != self.session_saved_changes
+
+    def autosave_session(self):
+        """定时在后台线程保存分类会话（只在有改动且上次保存已完成时进行）"""
+        try:
+            thread = self.session_save_thread
+            if self.session_dirty() and (thread is None or not thread.is_alive()):
+                df, state = self.df.copy(), self._session_state()
+                changes = self.session_changes
+
+                def worker():
+                    # 保存成功后才把这次快照的改动计为已保存，期间的新改动仍待保存
+                    try:
+                        save_classifier_session(self.session_file, df, state)
+                        self.session_saved_changes = changes
+                    except Exception as e:
+                        print(f"⚠️ 自动保存分类会话失败: {e}")
+
+                self.session_save_thread = threading.Thread(target=worker, daemon=True)
+                self.session_save_thread.start()
+        finally:
+            self.root.after(self.session_autosave_ms, self.autosave_session)
+
+    def save_session_as(self):
+        """把当前分类会话保存到指定文件"""
+        path = filedialog.asksaveasfilename(title="保存分类会话", defaultextension=".npz",
+                                            filetypes=[("分类会话", "*.npz")])
+        if not path:
+            return
+        try:
+            save_classifier_session(path, self.df, self._session_state())
+            self.show_temp_message(f"✓ 会话已保存：{Path(path).name}")
+        except Exception as e:
+            messagebox.showerror("错误", f"保存会话失败：{str(e)}")
+
+    def open_session(self):
+        """从文件打开分类会话"""
+        path = filedialog.askopenfilename(title="打开分类会话", filetypes=[("分类会话", "*.npz")])
+        if not path:
+            return
+        try:
+            df, meta = load_classifier_session(path)
+            self._apply_session(df, meta)
+            self.mark_session_dirty()
+            self.main_notebook.select(self.classifier_tab)
+            self.classifier_notebook.select(self.tab_plt)
+            self.show_temp_message(f"✓ 已打开会话：{len(df)} 条数据")
+        except Exception as e:
+            messagebox.showerror("错误", f"打开会话失败：{str(e)}")
+
     def reorder_dataframe(self):
         """重新整理DataFrame的Order列，确保顺序连续"""
         if 'Order' not in self.df.columns:
@@ -725,25 +2170,23 @@ class OCRApp:
         if not selected:
             return
             
+        edit = self.begin_edit()
         moved_items = []
         for item in selected:
             parent = self.tree.parent(item)
             if parent:
                 idx = self.tree.index(item)
                 if idx > 0:
-                    # 获取当前项目的DataFrame索引
-                    values = self.tree.item(item, 'values')
-                    if values and len(values) > 3:
-                        current_df_idx = int(values[3])
-                        moved_items.append(current_df_idx)
+                    moved_items.append((item, parent, idx, idx - 1))
                     
                     self.tree.move(item, parent, idx - 1)
         
-        # 更新DataFrame中的Order
+        # 只更新被移动项目的Order和所在分类的报告段
         if moved_items:
-            self.update_order_from_tree()
-        
-        self.generate_report_from_tree()
+            for item, _, _, _ in moved_items:
+                self.assign_order_key(item, edit)
+            self._commit_edit("移动项目", edit)
+            self.refresh_moved_items([move[1:] for move in moved_items])
 
     def move_item_down(self):
         """下移项目"""
@@ -751,6 +2194,7 @@ class OCRApp:
         if not selected:
             return
             
+        edit = self.begin_edit()
         moved_items = []
         for item in selected:
             parent = self.tree.parent(item)
@@ -758,38 +2202,110 @@ class OCRApp:
                 idx = self.tree.index(item)
                 siblings = self.tree.get_children(parent)
                 if idx < len(siblings) - 1:
-                    # 获取当前项目的DataFrame索引
-                    values = self.tree.item(item, 'values')
-                    if values and len(values) > 3:
-                        current_df_idx = int(values[3])
-                        moved_items.append(current_df_idx)
+                    moved_items.append((item, parent, idx, idx + 1))
                     
                     self.tree.move(item, parent, idx + 1)
         
-        # 更新DataFrame中的Order
+        # 只更新被移动项目的Order和所在分类的报告段
         if moved_items:
-            self.update_order_from_tree()
-        
-        self.generate_report_from_tree()
+            for item, _, _, _ in moved_items:
+                self.assign_order_key(item, edit)
+            self._commit_edit("移动项目", edit)
+            self.refresh_moved_items([move[1:] for move in moved_items])
+
+    def refresh_moved_items(self, moves):
+        """分类内移动后的局部刷新：目录树节点已经移到位，只在报告模型中同样移动并重写所在分类的报告段
+        moves: [(分类目录iid, 原位置, 新位置), ...]，按实际移动的先后顺序"""
+        sections = {key: (title, rows) for key, title, rows in self.report_sections}
+        touched = []
+        for parent, old_index, new_index in moves:
+            key = self.tree_sync.category_key(parent)
+            if key not in sections:
+                self.classify_and_display()
+                return
+            rows = sections[key][1]
+            rows.insert(new_index, rows.pop(old_index))
+            if key not in touched:
+                touched.append(key)
+        for key in touched:
+            title, rows = sections[key]
+            if not self.report_renderer.update_section(key, title, rows, self.is_text_red_color,
+                                                       self.font_style_trie.version):
+                self.generate_report_from_tree()
+                break
+        self.mark_session_dirty()
 
-    def update_order_from_tree(self):
+    def update_order_from_tree(self, edit=None):
         """从树视图的当前顺序更新DataFrame中的Order列"""
         if 'Order' not in self.df.columns:
-            self.df['Order'] = range(len(self.df))
+            self.edit_column(edit, 'Order', np.arange(len(self.df)))
             return
         
-        order_counter = 0
-        
-        # 遍历所有分类目录
+        # 按树中的先后顺序收集DataFrame索引，一次性写入连续的Order
+        tree_order = []
         for category_item in self.tree.get_children(""):
-            # 遍历该分类下的所有数据项
             for data_item in self.tree.get_children(category_item):
-                values = self.tree.item(data_item, 'values')
-                if values and len(values) > 3:
-                    df_idx = int(values[3])  # DataFrame中的索引
-                    if df_idx in self.df.index:
-                        self.df.loc[df_idx, 'Order'] = order_counter
-                        order_counter += 1
+                idx = self._tree_df_index(data_item)
+                if idx is not None:
+                    tree_order.append(idx)
+        if tree_order:
+            self.edit_cells(edit, tree_order, 'Order', np.arange(len(tree_order)))
+
+    def _tree_df_index(self, iid):
+        """树节点对应的DataFrame索引，分类目录或失效节点返回None"""
+        if not iid:
+            return None
+        values = self.tree.item(iid, 'values')
+        if values and len(values) > 3:
+            return self.row_index(values[3])
+        return None
+
+    def row_index(self, uid):
+        """目录树行保存的 Uid 对应的当前DataFrame索引，找不到时返回None（查找表随 self.df 对象重建）"""
+        if self._uid_lookup is None or self._uid_lookup[0] is not self.df:
+            self._uid_lookup = (self.df, pd.Index(self.df['Uid']))
+        pos = self._uid_lookup[1].get_indexer([int(uid)])[0]
+        return self.df.index[pos] if pos >= 0 else None
+
+    def assign_order_key(self, iid, edit=None):
+        """只给移动后的数据项写入新Order：取树中前后相邻项Order的中点，间隔过小时先重新均匀编号"""
+        idx = self._tree_df_index(iid)
+        if idx is None:
+            return
+        if 'Order' not in self.df.columns:
+            self.edit_column(edit, 'Order', np.arange(len(self.df), dtype=float))
+        if not pd.api.types.is_float_dtype(self.df['Order']):
+            self.edit_column(edit, 'Order', self.df['Order'].astype(float))
+        
+        prev_idx = self._tree_df_index(self.tree.prev(iid))
+        next_idx = self._tree_df_index(self.tree.next(iid))
+        for attempt in range(2):
+            lo = self.df.at[prev_idx, 'Order'] if prev_idx is not None else None
+            hi = self.df.at[next_idx, 'Order'] if next_idx is not None else None
+            if lo is None and hi is None:
+                return
+            if lo is None:
+                key = hi - 1
+            elif hi is None:
+                key = lo + 1
+            elif hi - lo > self.order_min_gap:
+                key = (lo + hi) / 2
+            elif attempt == 0:
+                self.rebalance_order(edit)
+                continue
+            else:
+                # 相邻项本身顺序与树不一致，退回按整棵树重新编号
+                self.update_order_from_tree(edit)
+                return
+            break
+        self.edit_cells(edit, [idx], 'Order', key)
+
+    def rebalance_order(self, edit=None):
+        """把Order重新编号为 0..n-1（保持现有先后关系，不移动行）"""
+        order = self.df['Order'].to_numpy()
+        ranks = np.empty(len(order))
+        ranks[np.argsort(order, kind='stable')] = np.arange(len(order))
+        self.edit_column(edit, 'Order', ranks)
 
     def open_add_data_dialog(self):
         """打开新增数据对话框 (美化版)"""
@@ -883,13 +2399,15 @@ class OCRApp:
                     next_order = self.df.iloc[insert_pos]['Order'] if insert_pos < len(self.df) else len(self.df)
                     new_order = (prev_order + next_order) / 2
                 
-                row = pd.DataFrame([[name, y_val, x_val, group_val, new_order]], columns=['Label', 'Y', 'X', 'Group', 'Order'])
-                self.df = pd.concat([self.df.iloc[:insert_pos], row, self.df.iloc[insert_pos:]]).reset_index(drop=True)
-                
-                # 重新整理Order列，确保顺序正确
-                self.reorder_dataframe()
+                edit = self.begin_edit()
+                row = pd.DataFrame([[name, y_val, x_val, group_val, new_order, -1, self.new_uids(1)[0], np.nan]],
+                                   columns=['Label', 'Y', 'X', 'Group', 'Order', 'Category', 'Uid', 'Height'])
+                # Order是可取中点的小数键，插入后不必整表重新编号
+                self.edit_insert_rows(edit, [min(insert_pos, len(self.df))], row)
                 
-                self.category_list, self.marked_indices = [], set()
+                # 分类随Category列保留，标记基于行号需清空
+                self.marked_indices = set()
+                self._commit_edit(f"新增 {name}", edit)
                 self.refresh_all()
                 dialog.destroy()
             except ValueError:
@@ -964,9 +2482,11 @@ class OCRApp:
         try:
             values = self.tree.item(iid, 'values')
             if values and len(values) > 3:
-                idx = int(values[3])
+                idx = self.row_index(values[3])
                 # 更新DataFrame中的组值
-                self.df.loc[idx, 'Group'] = group_value
+                edit = self.begin_edit()
+                self.edit_cells(edit, [idx], 'Group', group_value)
+                self._commit_edit(f"{values[0]} 改为{group_value}组", edit)
                 # 刷新显示
                 self.refresh_all()
                 self.show_temp_message(f"✓ 组已更新为：{group_value}")
@@ -987,12 +2507,17 @@ class OCRApp:
         if target and target != self.drag_source_item:
             dest_p = self.tree.parent(target) or target
             try:
-                self.tree.move(self.drag_source_item, dest_p, self.tree.index(target))
-                
-                # 更新DataFrame中的Order
-                self.update_order_from_tree()
-                
-                self.generate_report_from_tree()
+                src_p = self.tree.parent(self.drag_source_item)
+                # 跨分类拖拽不改变分类，也不按目标分类的邻居改写Order，项目留在原位
+                if src_p == dest_p:
+                    edit = self.begin_edit()
+                    old_index = self.tree.index(self.drag_source_item)
+                    self.tree.move(self.drag_source_item, dest_p, self.tree.index(target))
+                    
+                    # 只更新被拖拽项目的Order
+                    self.assign_order_key(self.drag_source_item, edit)
+                    self._commit_edit("拖拽排序", edit)
+                    self.refresh_moved_items([(dest_p, old_index, self.tree.index(self.drag_source_item))])
             except:
                 pass
         self.drag_source_item = None
@@ -1003,115 +2528,151 @@ class OCRApp:
         if not self.enable_lasso_mode.get():
             if event.button == 1:
                 val = round(event.ydata, 1)
-                if val not in self.thresholds: self.thresholds.append(val); self.thresholds.sort(); self.refresh_all()
+                i = bisect.bisect_left(self.thresholds, val)
+                if i == len(self.thresholds) or self.thresholds[i] != val:
+                    edit = self.begin_edit()
+                    self.thresholds.insert(i, val)
+                    self._commit_edit(f"添加分界线 {val}", edit)
+                    self.refresh_all()
             elif event.button == 3 and self.thresholds:
-                closest = min(self.thresholds, key=lambda x: abs(x - event.ydata))
+                closest = nearest_sorted(self.thresholds, event.ydata)
                 if abs(closest - event.ydata) < (self.ax.get_ylim()[1] - self.ax.get_ylim()[0]) * 0.05:
+                    edit = self.begin_edit()
                     self.thresholds.remove(closest);
+                    self._commit_edit(f"删除分界线 {closest}", edit)
                     self.refresh_all()
 
+    def auto_detect_row_thresholds(self):
+        """根据未圈选数据的Y坐标（和OCR行高）自动生成分行阈值线"""
+        rem_df = self.df[self.df['Category'] < 0] if 'Category' in self.df.columns else self.df
+        if rem_df.empty:
+            messagebox.showinfo("提示", "没有可分行的数据！")
+            return
+        heights = rem_df['Height'] if 'Height' in rem_df.columns else None
+        proposed = propose_row_thresholds(rem_df['Y'], heights)
+        if not proposed:
+            messagebox.showinfo("提示", "没有检测到明显的行间隔，请手动添加分界线。")
+            return
+        if self.thresholds and not messagebox.askyesno(
+                "确认", f"检测到 {len(proposed)} 条分界线，是否替换现有的 {len(self.thresholds)} 条？"):
+            return
+        edit = self.begin_edit()
+        self.thresholds = proposed
+        self._commit_edit(f"自动分行 {len(proposed)} 条", edit)
+        self.refresh_all()
+        self.show_temp_message(f"✓ 已自动生成 {len(proposed)} 条分界线，可在绘图区继续调整")
+
     def on_lasso_select(self, verts):
         """圈选事件"""
         if self.df.empty: return
-        path = MplPath(verts)
-        inside = path.contains_points(self.df[['X', 'Y']].values)
-        new_idx = set(self.df.index[inside].tolist())
-        if new_idx:
-            for cat in self.category_list: cat['indices'] -= new_idx
+        inside = self.point_index.contains(self.df[['X', 'Y']].to_numpy(dtype=float), verts)
+        if inside.any():
+            edit = self.begin_edit()
+            # 新圈选覆盖旧分类：直接改写这些行的Category
+            self.edit_cells(edit, inside, 'Category', len(self.category_list))
             cat_id = len(self.category_list) + 1
-            self.category_list.append({'name': f"圈选提取 {cat_id}", 'indices': new_idx,
+            self.category_list.append({'id': self.next_category_id, 'name': f"圈选提取 {cat_id}",
                                        'color': self.color_cycle[(cat_id - 1) % len(self.color_cycle)]})
+            self.next_category_id += 1
+            self._commit_edit(f"圈选提取 {cat_id}", edit)
             self.refresh_all()
 
     def update_plot_view(self):
-        """更新绘图视图"""
-        self.ax.clear();
-        self.ax.set_title("绘图交互区")
-        if not self.df.empty:
-            colors = ['#1f77b4'] * len(self.df);
-            sizes = [60] * len(self.df)
-            for i in self.df.index:
-                if i in self.marked_indices:
-                    colors[i], sizes[i] = 'red', 120
-                else:
-                    for cat in self.category_list:
-                        if i in cat['indices']: colors[i], sizes[i] = cat['color'], 100; break
-            self.ax.scatter(self.df['X'], self.df['Y'], c=colors, s=sizes, zorder=5)
-            for idx, row in self.df.iterrows():
-                m = idx in self.marked_indices
-                self.ax.annotate(row['Label'], (row['X'], row['Y']), xytext=(0, 5), textcoords="offset points",
-                                 ha='center', fontsize=9, color='red' if m else 'black',
-                                 weight='bold' if m else 'normal')
-        for y in self.thresholds: self.ax.axhline(y=y, color='blue', linestyle='--', alpha=0.5)
-        if self.enable_lasso_mode.get():
-            self.lasso = LassoSelector(self.ax, onselect=self.on_lasso_select, props={'color': 'red', 'linewidth': 1.5})
+        """更新绘图视图（持久化散点与标注，仅阈值线变化时走 blit）"""
+        if self.df.empty:
+            colors, sizes, marked = [], np.array([]), np.array([], dtype=bool)
         else:
-            if self.lasso: self.lasso.set_active(False); self.lasso = None
-        self.canvas.draw()
+            colors, sizes = self.point_styles()
+            marked = self.df.index.isin(list(self.marked_indices))
+        points_changed = self.plot_renderer.set_points(self.df, colors, sizes, marked)
+        lines_changed = self.plot_renderer.set_thresholds(self.thresholds)
+
+        # 圈选器只创建一次，切换模式时启用/停用
+        if self.enable_lasso_mode.get():
+            if self.lasso is None:
+                self.lasso = LassoSelector(self.ax, onselect=self.on_lasso_select, props={'color': 'red', 'linewidth': 1.5})
+            else:
+                self.lasso.set_active(True)
+        elif self.lasso:
+            self.lasso.set_active(False)
+
+        if points_changed:
+            self.canvas.draw_idle()
+        elif lines_changed:
+            self.plot_renderer.blit()
+
+    def point_styles(self):
+        """按Category列和标记一次性计算散点颜色与大小"""
+        n = len(self.df)
+        colors = np.full(n, '#1f77b4', dtype=object)
+        sizes = np.full(n, 60)
+        codes = self.df['Category'].to_numpy(dtype=int)
+        in_cat = (codes >= 0) & (codes < len(self.category_list))
+        if in_cat.any():
+            cat_colors = np.array([cat['color'] for cat in self.category_list], dtype=object)
+            colors[in_cat], sizes[in_cat] = cat_colors[codes[in_cat]], 100
+        marked = self.df.index.isin(list(self.marked_indices))
+        colors[marked], sizes[marked] = 'red', 120
+        return colors.tolist(), sizes
 
     def classify_and_display(self):
-        """分类并显示"""
-        for i in self.tree.get_children(): self.tree.delete(i)
-        if self.df.empty: return
+        """分类并显示（增量同步目录树）"""
+        if self.df.empty:
+            self.tree_sync.clear()
+            return
         
         # 配置字体样式标签
         self.configure_font_style_tags()
         
-        cat_idx = set()
-        for i, cat in enumerate(self.category_list):
-            if not cat['indices']: continue
+        categories = []
+        report_sections = []
+        # 目录 iid 按分类标识生成，删除或调整前面的分类不会牵动后面分类的节点
+        self.category_positions = {}
+        codes = self.df['Category']
+        for i, sub in self.df[codes >= 0].groupby('Category', sort=True):
+            i = int(i)
+            if i >= len(self.category_list): continue
+            cat = self.category_list[i]
+            key = f"lasso_{cat.get('id', f'pos{i}')}"
+            self.category_positions[key] = i
             tag = f"tag_{cat['color']}"
             self.tree.tag_configure(tag, foreground=cat['color'], font=("", self.current_font_size, "bold"))
-            pid = self.tree.insert("", "end", text=f"📂 {cat['name']}", open=True, tags=(tag,))
-            # 按Order列排序显示，如果没有Order列则按索引排序
-            if 'Order' in self.df.columns:
-                sorted_indices = sorted(list(cat['indices']), key=lambda x: self.df.loc[x, 'Order'] if x in self.df.index else float('inf'))
-            else:
-                sorted_indices = sorted(list(cat['indices']))
-            
-            for idx in sorted_indices:
-                m = idx in self.marked_indices
-                label_text = self.df.loc[idx, 'Label']
-                group = self.df.loc[idx, 'Group'] if 'Group' in self.df.columns else self.get_group_by_text_color(label_text)
-                
-                # 获取项目标签
-                item_tags = self.get_item_tags(label_text, group, m)
-                
-                self.tree.insert(pid, "end", values=(label_text, "✅ 标记" if m else "", group, idx),
-                                 tags=tuple(item_tags))
-                cat_idx.add(idx)
-        rem_df = self.df.drop(list(cat_idx))
+            categories.append((key, f"📂 {cat['name']}", (tag,), self.build_tree_rows(sub)))
+            report_sections.append((key, cat['name'], categories[-1][3]))
+        rem_df = self.df[codes < 0]
         if not rem_df.empty:
             t_sorted = sorted(self.thresholds)
-            line_cats = []
-            if not t_sorted:
-                line_cats.append(("数据区", rem_df))
-            else:
-                line_cats.append((f"低于 {t_sorted[0]}", rem_df[rem_df['Y'] < t_sorted[0]]))
-                for i in range(len(t_sorted) - 1):
-                    line_cats.append((f"{t_sorted[i]} ~ {t_sorted[i + 1]}",
-                                      rem_df[(rem_df['Y'] >= t_sorted[i]) & (rem_df['Y'] < t_sorted[i + 1])]))
-                line_cats.append((f"高于 {t_sorted[-1]}", rem_df[rem_df['Y'] >= t_sorted[-1]]))
-            for name, sub in line_cats:
-                if sub.empty: continue
-                pid = self.tree.insert("", "end", text=f"📂 {self.custom_cat_names.get(name, name)}", open=True)
-                # 按Order列排序显示
-                if 'Order' in sub.columns:
-                    sub_sorted = sub.sort_values('Order')
-                else:
-                    sub_sorted = sub
-                
-                for r_idx, r in sub_sorted.iterrows():
-                    m = r_idx in self.marked_indices
-                    label_text = r['Label']
-                    group = r.get('Group', self.get_group_by_text_color(label_text))
-                    
-                    # 获取项目标签
-                    item_tags = self.get_item_tags(label_text, group, m)
-                    
-                    self.tree.insert(pid, "end", values=(label_text, "✅ 标记" if m else "", group, r_idx),
-                                     tags=tuple(item_tags))
+            band_names = threshold_band_names(t_sorted)
+            bounds = ['min'] + t_sorted + ['max']
+            bands = assign_threshold_bands(rem_df['Y'], t_sorted)
+            # 按分区号一次分组，空分区自然不会出现
+            for b, sub in rem_df.groupby(bands, sort=True):
+                name = self.custom_cat_names.get(band_names[b], band_names[b])
+                # 阈值分区以其上下界为标识，不用分区序号
+                key = f"band_{bounds[b]}_{bounds[b + 1]}"
+                categories.append((key, f"📂 {name}", (), self.build_tree_rows(sub)))
+                report_sections.append((key, name, categories[-1][3]))
+        self.tree_sync.apply(categories)
+        # 报告直接取分类模型中的（名称, 组值）
+        self.report_sections = [(key, title, [(values[0], values[2]) for _, values, _ in rows])
+                                for key, title, rows in report_sections]
         self.generate_report_from_tree()
+
+    def build_tree_rows(self, sub):
+        """把一个分类的数据转换成目录树行 [(Uid, values, tags), ...]，按Order列排序；隐藏的Index列保存Uid"""
+        if 'Order' in sub.columns:
+            sub = sub.sort_values('Order', kind='stable')
+        if 'Group' in sub.columns:
+            groups = sub['Group']
+        else:
+            groups = sub['Label'].map(self.get_group_by_text_color)
+        rows = []
+        for idx, uid, label_text, group in zip(sub.index, sub['Uid'], sub['Label'], groups):
+            m = idx in self.marked_indices
+            uid = int(uid)
+            rows.append((uid, (label_text, "✅ 标记" if m else "", group, uid),
+                         tuple(self.get_item_tags(label_text, group, m))))
+        return rows
     
     def configure_font_style_tags(self):
         """配置字体样式标签"""
@@ -1205,109 +2766,32 @@ class OCRApp:
 
     def get_font_style_tag(self, text):
         """获取文本对应的字体样式标签"""
-        for prefix in self.font_style_rules:
-            if text.lower().startswith(prefix.lower()):
-                return f"font_style_{prefix}"
-        return None
-    
+        rule = self.font_style_trie.match(text)
+        return rule['tag'] if rule else None
+
     def get_group_by_text_color(self, text):
         """根据文字颜色获取组值"""
-        for prefix, style in self.font_style_rules.items():
-            if text.lower().startswith(prefix.lower()):
-                color = style.get('color', '#000000').upper()
-                # 检查是否为红色（支持多种红色表示）
-                if color in ['#FF0000', '#RED', 'RED'] or color.startswith('#FF'):
-                    return 'A'
+        rule = self.font_style_trie.match(text)
         # 默认返回B
-        return 'B'
+        return rule['group'] if rule else 'B'
 
     def is_text_red_color(self, text):
         """判断文字是否为红色"""
-        for prefix, style in self.font_style_rules.items():
-            if text.lower().startswith(prefix.lower()):
-                color = style.get('color', '#000000').upper()
-                # 检查是否为红色（支持多种红色表示）
-                if color in ['#FF0000', '#RED', 'RED'] or color.startswith('#FF'):
-                    return True
-        return False
+        rule = self.font_style_trie.match(text)
+        return rule['is_red'] if rule else False
 
     def generate_report_from_tree(self):
-        """从树生成报告 - 根据组值和红色文字添加空行分隔
+        """从分类模型生成报告 - 根据组值和红色文字添加空行分隔
         
         空行添加规则：
         1. 当组值改变时添加空行（原有规则）
         2. 当红色文字与红色文字之间时添加空行（新规则）
         3. 其他情况不添加空行
-        """
-        self.report_text.delete("1.0", tk.END)
-        content = ""
-        
-        for pid in self.tree.get_children(""):
-            title = self.tree.item(pid, "text").replace("📂 ", "")
-            children = self.tree.get_children(pid)
-            if not children: 
-                continue
-                
-            content += f"【{title}】:\n"
-            
-            # 收集所有数据项的信息，包括组值和颜色信息
-            items_data = []
-            for cid in children:
-                vals = self.tree.item(cid, "values")
-                if len(vals) >= 4:  # 确保有组值
-                    name = vals[0]
-                    group = vals[2]  # 组值在第3列（索引2）
-                    idx = int(vals[3])  # 索引在第4列（索引3）
-                    is_marked = idx in self.marked_indices
-                    is_red = self.is_text_red_color(name)  # 判断是否为红色文字
-                    items_data.append({
-                        'name': name,
-                        'group': group,
-                        'is_marked': is_marked,
-                        'is_red': is_red,
-                        'index': idx
-                    })
-            
-            # 按原始顺序处理数据，根据组值和红色文字添加空行
-            prev_group = None
-            prev_is_red = None
-            
-            for i, item in enumerate(items_data):
-                name = item['name']
-                group = item['group']
-                is_marked = item['is_marked']
-                is_red = item['is_red']
-                
-                # 添加空行的条件：
-                # 1. 组值改变了（原有规则）
-                # 2. 红色文字之间（新规则）
-                should_add_blank_line = False
-                blank_line_reason = ""
-                
-                if i > 0:  # 不是第一项
-                    # 原有规则：组值改变时添加空行
-                    if prev_group is not None and prev_group != group:
-                        should_add_blank_line = True
-                        blank_line_reason = f"组值变化: {prev_group} → {group}"
-                    
-                    # 新规则：红色文字之间添加空行
-                    elif prev_is_red and is_red:
-                        should_add_blank_line = True
-                        blank_line_reason = "红色文字之间"
-                
-                if should_add_blank_line:
-                    content += "\n"
-                
-                # 添加项目名称
-                content += f"{name}\n"
-                
-                prev_group = group
-                prev_is_red = is_red
-            
-            content += "\n"
         
-        # 插入到文本框
-        self.report_text.insert(tk.END, content)
+        每个分类的文字按内容缓存，只重写发生变化的分类段。
+        """
+        self.report_renderer.update(self.report_sections, self.is_text_red_color,
+                                    self.font_style_trie.version)
 
     def on_font_combo_change(self, event):
         """字体大小改变"""
@@ -1395,7 +2879,7 @@ class OCRApp:
             for child_iid in children:
                 values = self.tree.item(child_iid, 'values')
                 if values and len(values) > 3:
-                    idx = int(values[3])
+                    idx = self.row_index(values[3])
                     if idx in self.df.index:
                         current_group = values[2]
                         item_name = values[0]
@@ -1427,12 +2911,11 @@ class OCRApp:
                 return
             
             # 执行批量修改
-            changed_count = 0
-            for item in items_to_change:
-                idx = item['idx']
-                if idx in self.df.index:
-                    self.df.loc[idx, 'Group'] = target_group
-                    changed_count += 1
+            edit = self.begin_edit()
+            target_idx = [item['idx'] for item in items_to_change]
+            self.edit_cells(edit, target_idx, 'Group', target_group)
+            changed_count = len(target_idx)
+            self._commit_edit(f"分类「{category_name}」改为{target_group}组", edit)
             
             # 刷新显示
             self.refresh_all()
@@ -1459,7 +2942,7 @@ class OCRApp:
         try:
             values = self.tree.item(iid, 'values')
             if values and len(values) > 3:
-                idx = int(values[3])
+                idx = self.row_index(values[3])
                 old_group = values[2]
                 item_name = values[0]
                 
@@ -1467,7 +2950,9 @@ class OCRApp:
                 new_group = 'C'
                 
                 # 更新DataFrame中的组值
-                self.df.loc[idx, 'Group'] = new_group
+                edit = self.begin_edit()
+                self.edit_cells(edit, [idx], 'Group', new_group)
+                self._commit_edit(f"{item_name} 改为{new_group}组", edit)
                 
                 # 刷新显示
                 self.refresh_all()
@@ -1547,7 +3032,7 @@ class OCRApp:
         try:
             values = self.tree.item(iid, 'values')
             if values and len(values) > 3:
-                idx = int(values[3])
+                idx = self.row_index(values[3])
                 old_group = values[2]
                 item_name = values[0]
                 
@@ -1697,17 +3182,19 @@ class OCRApp:
                 return
             
             # 根据编辑类型更新数据
+            edit = self.begin_edit()
             if edit_info['edit_type'] == 'category':
                 # 更新分类名称
                 iid = edit_info['iid']
                 old_name = edit_info['original_value']
-                idx = self.tree.get_children("").index(iid)
+                idx = self.lasso_category_index(iid)
                 
-                if idx < len(self.category_list):
+                if idx is not None:
                     self.category_list[idx]['name'] = new_value
                 else:
                     self.custom_cat_names[old_name] = new_value
                 
+                self._commit_edit(f"重命名分类 {new_value}", edit)
                 self.refresh_all()
                 self.show_temp_message(f"✓ 分类已重命名：{new_value}")
                 
@@ -1715,8 +3202,9 @@ class OCRApp:
                 # 更新数据项名称
                 values = self.tree.item(edit_info['iid'], 'values')
                 if values and len(values) > 3:
-                    idx = int(values[3])
-                    self.df.loc[idx, 'Label'] = new_value
+                    idx = self.row_index(values[3])
+                    self.edit_cells(edit, [idx], 'Label', new_value)
+                    self._commit_edit(f"修改名称 {new_value}", edit)
                     self.refresh_all()
                     self.show_temp_message(f"✓ 已更新：{new_value}")
                     
@@ -1724,8 +3212,9 @@ class OCRApp:
                 # 更新数据项组
                 values = self.tree.item(edit_info['iid'], 'values')
                 if values and len(values) > 3:
-                    idx = int(values[3])
-                    self.df.loc[idx, 'Group'] = new_value
+                    idx = self.row_index(values[3])
+                    self.edit_cells(edit, [idx], 'Group', new_value)
+                    self._commit_edit(f"修改组为{new_value}", edit)
                     self.refresh_all()
                     self.show_temp_message(f"✓ 组已更新：{new_value}")
             
@@ -1808,26 +3297,15 @@ class OCRApp:
             messagebox.showinfo("提示", "没有数据可以处理！")
             return
         
-        # 收集所有需要拆分的项目（不依赖选择）
-        items_to_split = []
-        for idx, row in self.df.iterrows():
-            # 检查是否为A组且文字数大于2
-            if row['Group'] == 'A' and len(row['Label']) > 2:
-                items_to_split.append({
-                    'idx': idx,
-                    'label': row['Label'],
-                    'y': row['Y'],
-                    'x': row['X'],
-                    'order': row.get('Order', idx)
-                })
-        
-        if not items_to_split:
+        # 一次性筛选所有需要拆分的行（不依赖选择）
+        mask = (self.df['Group'] == 'A') & (self.df['Label'].astype(str).str.len() > 2)
+        count = int(mask.sum())
+        if not count:
             messagebox.showinfo("提示", "没有找到符合条件的项目！\n条件：组值为A且文字数大于2个字符")
             return
         
         # 确认对话框
-        count = len(items_to_split)
-        preview_text = "\n".join([f"• {item['label']}" for item in items_to_split[:10]])
+        preview_text = "\n".join([f"• {label}" for label in self.df.loc[mask, 'Label'].head(10)])
         if count > 10:
             preview_text += f"\n... 还有 {count-10} 个项目"
         
@@ -1840,75 +3318,37 @@ class OCRApp:
             return
         
         try:
-            # 按索引倒序处理，避免索引变化影响
-            items_to_split.sort(key=lambda x: x['idx'], reverse=True)
-            
-            split_count = 0
-            total_count = len(items_to_split)
-            
-            # 显示进度
-            self.progress_label.config(text=f"正在拆分项目... 0/{total_count}")
-            self.root.update()
-            
-            for i, item in enumerate(items_to_split):
-                idx = item['idx']
-                label = item['label']
-                y = item['y']
-                x = item['x']
-                order = item['order']
-                
-                # 更新进度
-                self.progress_label.config(text=f"正在拆分项目... {i+1}/{total_count} - {label}")
-                self.root.update()
-                
-                # 拆分文字：前两个字 + 其余字
-                first_part = label[:2]  # 前两个字
-                second_part = label[2:]  # 其余字
-                
-                # 删除原始行
-                self.df = self.df.drop(idx).reset_index(drop=True)
-                
-                # 重新整理Order列（因为删除了一行）
-                self.reorder_dataframe()
-                
-                # 计算插入位置（在原位置插入两个新行）
-                insert_pos = 0
-                for i, row in self.df.iterrows():
-                    if row.get('Order', i) >= order:
-                        insert_pos = i
-                        break
-                else:
-                    insert_pos = len(self.df)
-                
-                # 创建两个新行
-                # 第一个单元格：前两个字，组值A
-                first_order = order
-                first_row = pd.DataFrame([[first_part, y, x, 'A', first_order]], 
-                                       columns=['Label', 'Y', 'X', 'Group', 'Order'])
-                
-                # 第二个单元格：其余字，组值C，Order稍大一点
-                second_order = order + 0.1
-                second_row = pd.DataFrame([[second_part, y, x + 10, 'C', second_order]], 
-                                        columns=['Label', 'Y', 'X', 'Group', 'Order'])
-                
-                # 插入新行
-                self.df = pd.concat([
-                    self.df.iloc[:insert_pos], 
-                    first_row, 
-                    second_row, 
-                    self.df.iloc[insert_pos:]
-                ]).reset_index(drop=True)
-                
-                split_count += 1
+            self.progress_label.config(text=f"正在拆分 {count} 个项目...")
+            self.root.update_idletasks()
+            
+            edit = self.begin_edit()
+            if 'Order' not in self.df.columns:
+                self.edit_column(edit, 'Order', np.arange(len(self.df), dtype=float))
+            elif not pd.api.types.is_float_dtype(self.df['Order']):
+                self.edit_column(edit, 'Order', self.df['Order'].astype(float))
+            
+            # 原行改为前两个字 → A组；其余字 → C组（X右移10）作为新行紧跟在原行之后
+            mask = np.asarray(mask, dtype=bool)
+            src = self.df[mask]
+            labels = src['Label'].astype(str)
+            # 新行的Order取原行与下一个Order的中点，不必整表重新编号
+            orders = np.sort(self.df['Order'].to_numpy(dtype=float))
+            src_order = src['Order'].to_numpy(dtype=float)
+            nxt = np.searchsorted(orders, src_order, side='right')
+            next_order = np.where(nxt < len(orders), orders[np.minimum(nxt, len(orders) - 1)], src_order + 2)
+            second_rows = src.assign(Label=labels.str[2:], X=src['X'] + 10, Group='C',
+                                     Order=(src_order + next_order) / 2, Uid=self.new_uids(len(src)))
+            self.edit_cells(edit, src.index, 'Label', labels.str[:2].to_numpy())
+            self.edit_cells(edit, src.index, 'Group', 'A')
+            self.edit_insert_rows(edit, np.flatnonzero(mask) + np.arange(1, len(src) + 1), second_rows)
+            split_count = count
             
             # 清除进度显示
             self.progress_label.config(text="")
             
-            # 重新整理Order列，确保顺序正确
-            self.reorder_dataframe()
-            
-            # 清空分类和标记，重新刷新
-            self.category_list, self.marked_indices = [], set()
+            # 拆分出的行继承原分类，标记需清空
+            self.marked_indices = set()
+            self._commit_edit(f"拆分 {count} 个A组项目", edit)
             self.refresh_all()
             
             # 显示结果
@@ -1947,17 +3387,19 @@ class OCRApp:
         if not selected_items:
             return
             
+        edit = self.begin_edit()
         modified = False
         for iid in selected_items:
             # Check if item exists before accessing
             if self.tree.exists(iid) and self.tree.parent(iid):
                 values = self.tree.item(iid, 'values')
                 if values and len(values) > 3:
-                    idx = int(values[3])
+                    idx = self.row_index(values[3])
                     self.toggle_mark(idx, refresh=False)
                     modified = True
         
         if modified:
+            self._commit_edit("切换标记", edit)
             self.refresh_all()
         
         # 如果是按键触发的，防止默认行为（如滚动）
@@ -1981,7 +3423,7 @@ class OCRApp:
                         'iid': iid,
                         'name': values[0],
                         'current_group': values[2],
-                        'index': int(values[3])
+                        'index': self.row_index(values[3])
                     })
         
         if not data_items:
@@ -2050,15 +3492,12 @@ class OCRApp:
                 return
             
             # 执行批量修改
-            modified_count = 0
-            for item in data_items:
-                try:
-                    idx = item['index']
-                    if idx in self.df.index:
-                        self.df.loc[idx, 'Group'] = new_group
-                        modified_count += 1
-                except Exception as e:
-                    print(f"修改项目 {item['name']} 失败: {e}")
+            edit = self.begin_edit()
+            target_idx = [item['index'] for item in data_items if item['index'] in self.df.index]
+            modified_count = len(target_idx)
+            if target_idx:
+                self.edit_cells(edit, target_idx, 'Group', new_group)
+            self._commit_edit(f"批量改为{new_group}组", edit)
             
             # 刷新显示
             self.refresh_all()
@@ -2084,7 +3523,7 @@ class OCRApp:
             values = self.tree.item(iid, 'values')
             if values:
                 old_name = values[0]
-                idx = int(values[3])
+                idx = self.row_index(values[3])
                 
                 new_name = simpledialog.askstring(
                     "编辑名称", 
@@ -2100,6 +3539,20 @@ class OCRApp:
         except Exception as e:
             messagebox.showerror("错误", f"编辑名称失败：{str(e)}")
     
+    def assign_category_ids(self):
+        """为旧会话中没有标识的圈选分类补上标识，并让下一个标识跳过已用的"""
+        used = [cat['id'] for cat in self.category_list if 'id' in cat]
+        next_id = max(used + [self.next_category_id - 1]) + 1
+        for cat in self.category_list:
+            if 'id' not in cat:
+                cat['id'] = next_id
+                next_id += 1
+        self.next_category_id = next_id
+
+    def lasso_category_index(self, iid):
+        """分类目录对应圈选分类时返回其在category_list中的位置，阈值分区返回None"""
+        return self.category_positions.get(self.tree_sync.category_key(iid))
+
     def rename_category(self, iid):
         """重命名分类目录"""
         try:
@@ -2113,11 +3566,13 @@ class OCRApp:
             
             if new_name and new_name != old_name:
                 # 查找并更新分类名称
-                idx = self.tree.get_children("").index(iid)
-                if idx < len(self.category_list):
+                edit = self.begin_edit()
+                idx = self.lasso_category_index(iid)
+                if idx is not None:
                     self.category_list[idx]['name'] = new_name
                 else:
                     self.custom_cat_names[old_name] = new_name
+                self._commit_edit(f"重命名分类 {new_name}", edit)
                 
                 self.refresh_all()
                 messagebox.showinfo("成功", f"分类名称已更新：\n{old_name} → {new_name}")
@@ -2130,20 +3585,19 @@ class OCRApp:
             values = self.tree.item(iid, 'values')
             if values:
                 name = values[0]
-                idx = int(values[3])
+                idx = self.row_index(values[3])
                 
                 if messagebox.askyesno("确认删除", f"确定要删除以下数据项吗？\n\n名称：{name}"):
-                    # 从DataFrame中删除
-                    self.df = self.df.drop(idx).reset_index(drop=True)
-                    
-                    # 重新整理Order列
-                    self.reorder_dataframe()
+                    edit = self.begin_edit()
+                    # 从DataFrame中删除（Order是小数键，删除后不必重新编号）
+                    self.edit_delete_rows(edit, [idx])
                     
                     # 从标记集合中移除
                     if idx in self.marked_indices:
                         self.marked_indices.remove(idx)
                     # 更新索引（因为删除了一行，后面的索引都要减1）
                     self.marked_indices = {i-1 if i > idx else i for i in self.marked_indices if i != idx}
+                    self._commit_edit(f"删除 {name}", edit)
                     
                     self.refresh_all()
                     messagebox.showinfo("成功", f"已删除数据项：{name}")
@@ -2166,7 +3620,7 @@ class OCRApp:
             for child in children:
                 values = self.tree.item(child, 'values')
                 if values and len(values) > 3:
-                    idx = int(values[3])
+                    idx = self.row_index(values[3])
                     if idx in self.marked_indices:
                         marked_count += 1
             
@@ -2189,9 +3643,9 @@ class OCRApp:
         """更改分类颜色"""
         try:
             category_name = self.tree.item(iid, "text").replace("📂 ", "")
-            idx = self.tree.get_children("").index(iid)
+            idx = self.lasso_category_index(iid)
             
-            if idx < len(self.category_list):
+            if idx is not None:
                 current_color = self.category_list[idx]['color']
                 
                 # 创建颜色选择对话框
@@ -2241,7 +3695,9 @@ class OCRApp:
                 
                 # 应用新颜色
                 if selected_color[0] != current_color:
+                    edit = self.begin_edit()
                     self.category_list[idx]['color'] = selected_color[0]
+                    self._commit_edit(f"分类「{category_name}」换色", edit)
                     self.refresh_all()
                     messagebox.showinfo("成功", f"分类「{category_name}」的颜色已更新")
             else:
@@ -2259,6 +3715,7 @@ class OCRApp:
             
             self.update_plot_view()
             self.classify_and_display()
+            self.mark_session_dirty()
             
             # 清除处理提示
             if hasattr(self, 'progress_label'):
@@ -2273,17 +3730,24 @@ class OCRApp:
     def delete_selected_data(self):
         """删除选中数据"""
         items = self.tree.selection()
-        indices = [int(self.tree.item(i, 'values')[3]) for i in items if self.tree.parent(i)]
+        indices = [self.row_index(self.tree.item(i, 'values')[3]) for i in items if self.tree.parent(i)]
         if indices and messagebox.askyesno("确认", "删除数据？"):
-            self.df = self.df.drop(indices).reset_index(drop=True)
-            # 重新整理Order列
-            self.reorder_dataframe()
-            self.category_list, self.marked_indices = [], set();
+            edit = self.begin_edit()
+            self.edit_delete_rows(edit, indices)
+            self.marked_indices = set();
+            self._commit_edit(f"删除 {len(indices)} 项", edit)
             self.refresh_all()
 
     def reset_all(self):
         """重置所有"""
+        edit = self.begin_edit()
         self.thresholds, self.category_list, self.marked_indices, self.custom_cat_names = [], [], set(), {};
+        if 'Category' in self.df.columns:
+            # 只记录原本有分类的行
+            self.edit_cells(edit, (self.df['Category'] != -1).to_numpy(), 'Category', -1)
+        else:
+            self.edit_column(edit, 'Category', -1)
+        self._commit_edit("清空分类", edit)
         self.refresh_all()
     
     def add_spaces_to_tree_items(self):
@@ -2393,6 +3857,29 @@ class OCRApp:
         tk.Label(custom_frame, text=examples_text, 
                 font=("Arial", 9), fg="gray", justify=tk.LEFT).pack(anchor=tk.W, pady=(5, 0))
         
+        # 输入时实时统计会被修改的项目数
+        live_count_label = tk.Label(custom_frame, text="", font=("Arial", 9), fg="#2196F3")
+        live_count_label.pack(anchor=tk.W, pady=(5, 0))
+        live_job = [None]
+        
+        def update_live_count():
+            live_job[0] = None
+            if not live_count_label.winfo_exists():
+                return
+            custom_chars = self.custom_chars_var.get().strip()
+            if self.df.empty or not custom_chars:
+                live_count_label.config(text="")
+                return
+            modified = self.apply_space_rules_to_labels(self.df['Label'], custom_chars)
+            live_count_label.config(text=f"实时预览：将修改 {int((modified != self.df['Label']).sum())}/{len(self.df)} 个项目")
+        
+        def schedule_live_count(*args):
+            if live_job[0]:
+                rules_window.after_cancel(live_job[0])
+            live_job[0] = rules_window.after(200, update_live_count)
+        
+        self.custom_chars_var.trace_add("write", schedule_live_count)
+        
         # 按钮框架
         btn_frame = tk.Frame(rules_window, pady=15)
         btn_frame.pack(fill=tk.X)
@@ -2456,16 +3943,16 @@ class OCRApp:
     def apply_space_rules(self, selected_rules, custom_chars):
         """应用空格规则到数据"""
         try:
-            modified_count = 0
             total_count = len(self.df)
             
-            for idx in self.df.index:
-                original_text = self.df.loc[idx, 'Label']
-                modified_text = self.process_text_with_space_rules(original_text, selected_rules, custom_chars)
-                
-                if modified_text != original_text:
-                    self.df.loc[idx, 'Label'] = modified_text
-                    modified_count += 1
+            # 整列一次性处理，只写回发生变化的行
+            modified = self.apply_space_rules_to_labels(self.df['Label'], custom_chars)
+            changed = modified != self.df['Label']
+            modified_count = int(changed.sum())
+            if modified_count:
+                edit = self.begin_edit()
+                self.edit_cells(edit, changed.to_numpy(), 'Label', modified[changed].to_numpy())
+                self._commit_edit(f"插入空格（{modified_count} 项）", edit)
             
             # 刷新显示
             self.refresh_all()
@@ -2513,24 +4000,18 @@ class OCRApp:
             preview_content = "预览结果（显示前10个会发生变化的项目）：\n"
             preview_content += "="*60 + "\n\n"
             
-            changed_count = 0
-            for idx in self.df.index:
-                if changed_count >= 10:
-                    break
-                    
-                original_text = self.df.loc[idx, 'Label']
-                modified_text = self.process_text_with_space_rules(original_text, selected_rules, custom_chars)
-                
-                if modified_text != original_text:
-                    changed_count += 1
-                    preview_content += f"{changed_count}. 原文：{original_text}\n"
-                    preview_content += f"   修改：{modified_text}\n\n"
+            modified = self.apply_space_rules_to_labels(self.df['Label'], custom_chars)
+            changed = modified != self.df['Label']
+            total_changes = int(changed.sum())
             
-            if changed_count == 0:
+            for changed_count, (original_text, modified_text) in enumerate(
+                    zip(self.df.loc[changed, 'Label'].head(10), modified[changed].head(10)), 1):
+                preview_content += f"{changed_count}. 原文：{original_text}\n"
+                preview_content += f"   修改：{modified_text}\n\n"
+            
+            if total_changes == 0:
                 preview_content += "没有项目会发生变化。\n"
-            elif changed_count == 10:
-                total_changes = sum(1 for idx in self.df.index 
-                                  if self.process_text_with_space_rules(self.df.loc[idx, 'Label'], selected_rules, custom_chars) != self.df.loc[idx, 'Label'])
+            elif total_changes > 10:
                 preview_content += f"... 还有 {total_changes - 10} 个项目会发生变化\n"
             
             preview_text.insert(tk.END, preview_content)
@@ -2543,31 +4024,24 @@ class OCRApp:
         except Exception as e:
             messagebox.showerror("错误", f"预览失败：{str(e)}")
     
+    def get_space_rule_pattern(self, custom_chars):
+        """取得编译后的空格规则（compile_space_rules 只缓存最近几组，实时预览不会无限累积）"""
+        return compile_space_rules(custom_chars or '')
+    
+    def apply_space_rules_to_labels(self, labels, custom_chars):
+        """对整列名称插入空格并清理多余空白，返回新的Series"""
+        result = labels.astype(str)
+        pattern = self.get_space_rule_pattern(custom_chars)
+        if pattern is not None:
+            result = result.str.replace(pattern, ' ', regex=True)
+        return result.str.replace(r'\s+', ' ', regex=True).str.strip()
+    
     def process_text_with_space_rules(self, text, selected_rules, custom_chars):
         """根据规则处理文本，插入空格（只处理自定义字符）"""
-        import re
-        
         result = text
-        
-        # 只应用自定义字符规则
-        if custom_chars:
-            # 新逻辑：用户输入要分割的词（如“一时”），程序将其变为“一 时”
-            # 支持分隔符：| , ， 空格
-            tokens = re.split(r'[|,\s，]+', custom_chars)
-            tokens = [t.strip() for t in tokens if t.strip()]
-            
-            for token in tokens:
-                # 只处理2个字的词
-                if len(token) == 2:
-                    char1 = token[0]
-                    char2 = token[1]
-                    
-                    escaped_char1 = re.escape(char1)
-                    escaped_char2 = re.escape(char2)
-                    
-                    # 创建正则表达式模式
-                    pattern = fr'({escaped_char1})({escaped_char2})'
-                    result = re.sub(pattern, r'\1 \2', result)
+        pattern = self.get_space_rule_pattern(custom_chars)
+        if pattern is not None:
+            result = pattern.sub(' ', result)
         
         # 清理多余的空格
         result = re.sub(r'\s+', ' ', result).strip()
@@ -2755,19 +4229,32 @@ class OCRApp:
             if len(parts) >= 3:
                 try:
                     # 如果有第4列，作为组，否则根据文字颜色自动判断
+                    height = np.nan
                     if len(parts) > 3 and parts[3].strip() in ['A', 'B', 'C']:
                         group = parts[3].strip()
                     else:
+                        # 第4列为数字时是OCR给出的行高
+                        if len(parts) > 3:
+                            try:
+                                height = float(parts[3])
+                            except ValueError:
+                                pass
                         # 根据文字颜色自动设置组值
                         group = self.get_group_by_text_color(parts[0].strip())
-                    data.append([parts[0].strip(), float(parts[1]), float(parts[2]), group])
+                    data.append([parts[0].strip(), float(parts[1]), float(parts[2]), group, height])
                 except:
                     continue
         if data:
-            self.df = pd.DataFrame(data, columns=['Label', 'Y', 'X', 'Group'])
+            self.df = pd.DataFrame(data, columns=['Label', 'Y', 'X', 'Group', 'Height'])
             # 添加Order列，初始顺序就是数据的原始顺序
             self.df['Order'] = range(len(self.df));
+            self.df['Category'] = -1
+            self.df['Uid'] = range(len(self.df))
+            self.next_uid = len(self.df)
             self.reset_all();
+            # 新数据集，旧的撤销记录不再适用
+            self.history.clear()
+            self.update_undo_buttons()
             self.main_notebook.select(self.classifier_tab)
             self.classifier_notebook.select(self.tab_plt)
 
@@ -2993,33 +4480,39 @@ class OCRApp:
         tk.Button(option_window, text="取消", command=option_window.destroy,
                  bg="#757575", fg="white", padx=30, pady=8).pack(pady=15)
     
+    def _start_merged_ocr(self, pages, mode):
+        """用户确认识别并选定模式后，按该模式的文件大小上限编码各张拼接图片 [(图片, 名称, 布局), ...] 并开始识别"""
+        self.image_paths, self.merge_layouts = [], {}
+        for merged_image, name, layout in pages:
+            ocr_source = MemoryImage.encode(merged_image, name, OCR_MAX_FILE_SIZE_MB[mode])
+            self.image_paths.append(ocr_source)
+            self.merge_layouts[ocr_source] = layout
+        perform = {'accurate': self.perform_ocr, 'basic': self.perform_quick_ocr, 'general': self.perform_general_ocr}[mode]
+        self.root.after(500, perform)
+    
     def _merge_images_from_drag(self, file_paths):
         """从拖放触发的拼接图片功能"""
         try:
-            # 加载所有图片
-            images = []
-            for path in file_paths:
-                img = Image.open(path)
-                images.append(img)
+            # 只读文件头获取尺寸，粘贴时再逐张解码
+            sizes = [image_size(path) for path in file_paths]
             
             # 计算拼接后的尺寸
-            total_width = sum(img.width for img in images)
-            max_height = max(img.height for img in images)
+            total_width = sum(w for w, h in sizes)
+            max_height = max(h for w, h in sizes)
             
-            # 创建拼接图片（从右到左）
-            merged_image = Image.new('RGB', (total_width, max_height), 'white')
+            # 创建拼接图片（从右到左，磁盘映射画布），并记录布局供识别后恢复阅读顺序
+            layout = right_to_left_layout(sizes, [os.path.basename(p) for p in file_paths])
+            merged_image = StripMergeCanvas(total_width, max_height)
             
-            x_offset = 0
-            for img in reversed(images):
-                y_offset = (max_height - img.height) // 2
-                merged_image.paste(img, (x_offset, y_offset))
-                x_offset += img.width
+            for path, src in zip(file_paths, layout['sources']):
+                with Image.open(path) as img:
+                    merged_image.paste(img, (src['x'], src['y']))
             
             # 询问是否保存
             save_choice = messagebox.askyesnocancel(
                 "拼接完成",
                 f"拼接完成！\n\n"
-                f"图片数量: {len(images)}\n"
+                f"图片数量: {len(file_paths)}\n"
                 f"拼接尺寸: {total_width}x{max_height}\n\n"
                 f"是否保存拼接后的图片？\n\n"
                 f"「是」= 保存图片并识别\n"
@@ -3030,18 +4523,15 @@ class OCRApp:
             if save_choice is None:  # 取消
                 return
             
-            # 保存到临时文件
-            import tempfile
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, "merged_temp.jpg")
-            merged_image.save(temp_path, format='JPEG', quality=90)
+            # 识别来源的名称；确认识别并选定模式后才编码
+            source_name = f"拼接图片_{len(file_paths)}张_{total_width}x{max_height}.jpg"
             
             # 如果选择保存
             if save_choice:
                 save_path = filedialog.asksaveasfilename(
                     defaultextension=".jpg",
                     filetypes=[("JPEG图片", "*.jpg"), ("PNG图片", "*.png"), ("所有文件", "*.*")],
-                    initialfile=f"merged_{len(images)}images_{total_width}x{max_height}.jpg"
+                    initialfile=f"merged_{len(file_paths)}images_{total_width}x{max_height}.jpg"
                 )
                 
                 if save_path:
@@ -3052,7 +4542,7 @@ class OCRApp:
                     
                     self.progress_label.config(
                         text=f"✓ 拼接图片已保存到：{os.path.basename(save_path)}")
-                    temp_path = save_path
+                    source_name = os.path.basename(save_path)
             
             # 继续识别流程
             result = messagebox.askyesno("开始识别", 
@@ -3060,19 +4550,13 @@ class OCRApp:
                 f"拼接尺寸: {total_width}x{max_height}")
             
             if result:
-                self.image_paths = [temp_path]
                 self.file_label.config(
-                    text=f"已选择: 拼接图片 ({len(images)}张) - {total_width}x{max_height}", 
+                    text=f"已选择: 拼接图片 ({len(file_paths)}张) - {total_width}x{max_height}", 
                     fg="blue")
                 
-                # 检查尺寸并启用相应按钮
-                width_in_accurate = self.size_limits["accurate_min_width"] <= total_width <= self.size_limits["accurate_max_width"]
-                height_in_accurate = self.size_limits["accurate_min_height"] <= max_height <= self.size_limits["accurate_max_height"]
-                meets_accurate = width_in_accurate and height_in_accurate
-                
-                width_in_basic = self.size_limits["basic_min_width"] <= total_width <= self.size_limits["basic_max_width"]
-                height_in_basic = self.size_limits["basic_min_height"] <= max_height <= self.size_limits["basic_max_height"]
-                meets_basic = width_in_basic and height_in_basic
+                # 检查尺寸并启用相应按钮（只看下限，超出上限的拼接图识别时自动分块）
+                meets_accurate = total_width >= self.size_limits["accurate_min_width"] and max_height >= self.size_limits["accurate_min_height"]
+                meets_basic = total_width >= self.size_limits["basic_min_width"] and max_height >= self.size_limits["basic_min_height"]
                 
                 if meets_accurate:
                     self.ocr_btn.config(state=tk.NORMAL)
@@ -3093,19 +4577,19 @@ class OCRApp:
                         f"「是」= 高精度识别\n"
                         f"「否」= 快速识别")
                     if ocr_choice:
-                        self.root.after(500, self.perform_ocr)
+                        self._start_merged_ocr([(merged_image, source_name, layout)], 'accurate')
                     else:
-                        self.root.after(500, self.perform_quick_ocr)
+                        self._start_merged_ocr([(merged_image, source_name, layout)], 'basic')
                 elif meets_accurate:
-                    self.root.after(500, self.perform_ocr)
+                    self._start_merged_ocr([(merged_image, source_name, layout)], 'accurate')
                 elif meets_basic:
-                    self.root.after(500, self.perform_quick_ocr)
+                    self._start_merged_ocr([(merged_image, source_name, layout)], 'basic')
                 else:
                     messagebox.showwarning("警告", 
-                        f"拼接后的图片尺寸不符合任何识别要求\n\n"
+                        f"拼接后的图片尺寸不足，无法识别\n\n"
                         f"当前尺寸: {total_width}x{max_height}\n"
                         f"高精度要求: 宽≥{self.size_limits['accurate_min_width']} 且 高≥{self.size_limits['accurate_min_height']}\n"
-                        f"快速识别要求: 宽<{self.size_limits['basic_max_width']} 且 高<{self.size_limits['basic_max_height']}")
+                        f"快速识别要求: 宽≥{self.size_limits['basic_min_width']} 且 高≥{self.size_limits['basic_min_height']}")
         
         except Exception as e:
             messagebox.showerror("错误", f"拼接失败：{str(e)}")
@@ -3293,9 +4777,9 @@ class OCRApp:
         self.image_paths = [file_path]
         
         try:
-            img = Image.open(file_path)
+            img = open_ocr_source(file_path)
             width, height = img.size
-            file_size = os.path.getsize(file_path)
+            file_size = len(file_path.data) if isinstance(file_path, MemoryImage) else os.path.getsize(file_path)
             
             if file_size < 1024 * 1024:
                 size_str = f"{file_size/1024:.1f}KB"
@@ -3305,19 +4789,19 @@ class OCRApp:
             if self.size_limit_unlocked:
                 meets_accurate_requirement = True
             else:
-                # 高精度：宽度和高度都在范围内（两个都要满足）
-                width_in_accurate_range = self.size_limits["accurate_min_width"] <= width <= self.size_limits["accurate_max_width"]
-                height_in_accurate_range = self.size_limits["accurate_min_height"] <= height <= self.size_limits["accurate_max_height"]
+                # 高精度：宽度和高度都不低于下限（超出上限的图片会分块识别）
+                width_in_accurate_range = width >= self.size_limits["accurate_min_width"]
+                height_in_accurate_range = height >= self.size_limits["accurate_min_height"]
                 meets_accurate_requirement = width_in_accurate_range and height_in_accurate_range
             
-            # 快速识别：宽度和高度都在范围内（两个都要满足）
-            width_in_basic_range = self.size_limits["basic_min_width"] <= width <= self.size_limits["basic_max_width"]
-            height_in_basic_range = self.size_limits["basic_min_height"] <= height <= self.size_limits["basic_max_height"]
+            # 快速识别：宽度和高度都不低于下限
+            width_in_basic_range = width >= self.size_limits["basic_min_width"]
+            height_in_basic_range = height >= self.size_limits["basic_min_height"]
             meets_basic_requirement = width_in_basic_range and height_in_basic_range
             
-            # 通用识别：宽度和高度都在范围内（两个都要满足）
-            width_in_general_range = self.size_limits["general_min_width"] <= width <= self.size_limits["general_max_width"]
-            height_in_general_range = self.size_limits["general_min_height"] <= height <= self.size_limits["general_max_height"]
+            # 通用识别：宽度和高度都不低于下限
+            width_in_general_range = width >= self.size_limits["general_min_width"]
+            height_in_general_range = height >= self.size_limits["general_min_height"]
             meets_general_requirement = width_in_general_range and height_in_general_range
             
             # 统计符合的模式数量
@@ -3338,29 +4822,29 @@ class OCRApp:
             
             if len(available_modes) == 3:
                 # 三种模式都可用
-                info_text = f"已选择: {os.path.basename(file_path)} ({width}x{height}, {size_str}){unlock_hint}"
+                info_text = f"已选择: {ocr_source_name(file_path)} ({width}x{height}, {size_str}){unlock_hint}"
                 self.file_label.config(text=info_text, fg="black")
                 self.progress_label.config(text="")
             elif len(available_modes) == 2:
                 # 两种模式可用
                 modes_str = "、".join(available_modes)
-                info_text = f"已选择: {os.path.basename(file_path)} ({width}x{height}, {size_str}){unlock_hint} ✓ 可用: {modes_str}"
+                info_text = f"已选择: {ocr_source_name(file_path)} ({width}x{height}, {size_str}){unlock_hint} ✓ 可用: {modes_str}"
                 self.file_label.config(text=info_text, fg="blue")
                 unavailable = [m for m in ["高精度", "快速", "通用"] if m not in available_modes]
                 self.progress_label.config(text=f"💡 提示：{unavailable[0]}识别不可用，建议使用{modes_str}识别")
             elif len(available_modes) == 1:
                 # 只有一种模式可用
                 mode_str = available_modes[0]
-                info_text = f"已选择: {os.path.basename(file_path)} ({width}x{height}, {size_str}){unlock_hint} ⚠️ 仅可用: {mode_str}"
+                info_text = f"已选择: {ocr_source_name(file_path)} ({width}x{height}, {size_str}){unlock_hint} ⚠️ 仅可用: {mode_str}"
                 self.file_label.config(text=info_text, fg="orange")
                 self.progress_label.config(text=f"💡 提示：该图片尺寸仅符合{mode_str}识别要求")
             else:
                 # 没有可用模式
-                info_text = f"已选择: {os.path.basename(file_path)} ({width}x{height}, {size_str}) ❌ 尺寸不符合任何识别要求"
+                info_text = f"已选择: {ocr_source_name(file_path)} ({width}x{height}, {size_str}) ❌ 尺寸不符合任何识别要求"
                 self.file_label.config(text=info_text, fg="red")
                 self.progress_label.config(text="❌ 错误：图片尺寸不符合任何识别要求，请检查图片尺寸或点击「解锁限制」")
         except:
-            self.file_label.config(text=f"已选择: {os.path.basename(file_path)}", fg="black")
+            self.file_label.config(text=f"已选择: {ocr_source_name(file_path)}", fg="black")
             self.ocr_btn.config(state=tk.NORMAL)
             self.quick_ocr_btn.config(state=tk.NORMAL)
             self.general_ocr_btn.config(state=tk.NORMAL)
@@ -3392,27 +4876,28 @@ class OCRApp:
         try:
             total_size = 0
             for path in self.image_paths:
-                total_size += os.path.getsize(path)
+                # 裁剪拼接的多张合成图以 MemoryImage 形式放在列表中
+                total_size += len(path.data) if isinstance(path, MemoryImage) else os.path.getsize(path)
                 try:
-                    img = Image.open(path)
+                    img = open_ocr_source(path)
                     width, height = img.size
                     
                     if self.size_limit_unlocked:
                         meets_accurate = True
                     else:
-                        # 高精度：宽度和高度都在范围内
-                        width_in_accurate = self.size_limits["accurate_min_width"] <= width <= self.size_limits["accurate_max_width"]
-                        height_in_accurate = self.size_limits["accurate_min_height"] <= height <= self.size_limits["accurate_max_height"]
+                        # 高精度：宽度和高度都不低于下限（超出上限的图片会分块识别）
+                        width_in_accurate = width >= self.size_limits["accurate_min_width"]
+                        height_in_accurate = height >= self.size_limits["accurate_min_height"]
                         meets_accurate = width_in_accurate and height_in_accurate
                     
-                    # 快速识别：宽度和高度都在范围内
-                    width_in_basic = self.size_limits["basic_min_width"] <= width <= self.size_limits["basic_max_width"]
-                    height_in_basic = self.size_limits["basic_min_height"] <= height <= self.size_limits["basic_max_height"]
+                    # 快速识别：宽度和高度都不低于下限
+                    width_in_basic = width >= self.size_limits["basic_min_width"]
+                    height_in_basic = height >= self.size_limits["basic_min_height"]
                     meets_basic = width_in_basic and height_in_basic
                     
-                    # 通用识别：宽度和高度都在范围内
-                    width_in_general = self.size_limits["general_min_width"] <= width <= self.size_limits["general_max_width"]
-                    height_in_general = self.size_limits["general_min_height"] <= height <= self.size_limits["general_max_height"]
+                    # 通用识别：宽度和高度都不低于下限
+                    width_in_general = width >= self.size_limits["general_min_width"]
+                    height_in_general = height >= self.size_limits["general_min_height"]
                     meets_general = width_in_general and height_in_general
                     
                     # 统计各种组合
@@ -3518,6 +5003,91 @@ class OCRApp:
         thread = threading.Thread(target=self._perform_ocr_thread, daemon=True)
         thread.start()
     
+    def mode_size_range(self, mode):
+        """识别模式实际可用的尺寸范围 (最小宽, 最小高, 最大宽, 最大高)：上限不超过接口支持的最长边，高精度解锁后不限下限"""
+        limits = self.size_limits
+        max_width = min(limits[f'{mode}_max_width'], OCR_MAX_IMAGE_SIDE[mode])
+        max_height = min(limits[f'{mode}_max_height'], OCR_MAX_IMAGE_SIDE[mode])
+        if mode == 'accurate' and self.size_limit_unlocked:
+            return 0, 0, max_width, max_height
+        return limits[f'{mode}_min_width'], limits[f'{mode}_min_height'], max_width, max_height
+    
+    def plan_merge_pages(self, sizes, names=None, modes=('basic', 'general', 'accurate')):
+        """按各识别模式的尺寸限制装箱，返回合成图数量最少的 (模式, 布局列表)；数量相同时按 modes 的顺序优先"""
+        best = None
+        for mode in modes:
+            min_width, min_height, max_width, max_height = self.mode_size_range(mode)
+            pages = pack_merge_pages(sizes, max_width, max_height, min_width, min_height, names)
+            if best is None or len(pages) < len(best[1]):
+                best = (mode, pages)
+        return best
+
+    def toggle_auto_trim(self):
+        """切换识别前自动裁边（后台线程读取普通属性，不直接访问 Tk 变量）"""
+        self.auto_trim_enabled = self.auto_trim_var.get()
+        self.store.set('auto_trim', self.auto_trim_enabled)
+    
+    def _prepare_ocr_source(self, image_path, mode):
+        """识别前的预处理：开启自动裁边时裁掉空白边距，返回 (识别来源, 坐标偏移, 尺寸)"""
+        with open_ocr_source(image_path) as img:
+            size = img.size
+            if not self.auto_trim_enabled:
+                return image_path, (0, 0), size
+            try:
+                bbox = content_bbox(img)
+                # 空白不到 5% 时不值得重新编码
+                if bbox is None or (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) > 0.95 * size[0] * size[1]:
+                    return image_path, (0, 0), size
+                trimmed = img.crop(bbox)
+                source = MemoryImage.encode(trimmed, ocr_source_name(image_path), OCR_MAX_FILE_SIZE_MB[mode])
+            except Exception as e:
+                # 裁边失败不影响识别：按原图继续，尺寸照常用于限制检查
+                self.root.after(0, lambda err=str(e): self.result_text.insert(
+                    tk.END, f"⚠️ 自动裁边失败，按原图识别: {err}\n"))
+                return image_path, (0, 0), size
+        self.root.after(0, lambda: self.result_text.insert(
+            tk.END, f"✂️ 已裁掉空白边距: {size[0]}x{size[1]} → {trimmed.width}x{trimmed.height}\n"))
+        return source, bbox[:2], trimmed.size
+    
+    def recognize(self, mode, ocr_source, offset=(0, 0), size=None):
+        """识别一张图片；超出模式尺寸上限时沿空白间隙切块并发识别再合并，location 统一平移回原图坐标"""
+        ocr_func = OCR_FUNCTIONS[mode]
+        min_width, min_height, max_width, max_height = self.mode_size_range(mode)
+        if size is None or (size[0] <= max_width and size[1] <= max_height):
+            result = ocr_func(ocr_source)
+            offset_ocr_locations(result.get("words_result", []), offset)
+            return result
+        
+        name = ocr_source_name(ocr_source)
+        with open_ocr_source(ocr_source) as img:
+            img.load()
+            tiles = split_whitespace_tiles(img, max_width, max_height, min_width, min_height)
+            self.root.after(0, lambda n=len(tiles): self.result_text.insert(
+                tk.END, f"📐 超出尺寸上限，已沿空白间隙切成 {n} 块并行识别\n"))
+            
+            def recognize_tile(i):
+                return ocr_func(MemoryImage.encode(img.crop(tiles[i]), f"{name} #{i + 1}", OCR_MAX_FILE_SIZE_MB[mode]))
+            
+            with ThreadPoolExecutor(max_workers=self.store.get('batch_workers', 3)) as pool:
+                results = list(pool.map(recognize_tile, range(len(tiles))))
+        for result in results:
+            if "words_result" not in result:
+                return result
+        words_result = merge_tile_results(tiles, [result["words_result"] for result in results])
+        offset_ocr_locations(words_result, offset)
+        print(f"✓ 分块识别完成: {name}，{len(tiles)} 块，合并后 {len(words_result)} 行")
+        return {"words_result": words_result, "words_result_num": len(words_result), "tiles": len(tiles)}
+    
+    def order_ocr_lines(self, image_path, words_result):
+        """按阅读顺序重排识别结果：拼接图片使用记录的布局，单张竖排图片按栏排序，其余保持接口顺序"""
+        if not words_result or not any('location' in item for item in words_result):
+            return words_result
+        layout = self.merge_layouts.get(image_path)
+        order, source, column, vertical = reading_order(words_result, layout)
+        if layout is None and not vertical:
+            return words_result
+        return [words_result[i] for i in order]
+
     def _perform_ocr_thread(self):
         """OCR识别线程（后台执行）"""
         try:
@@ -3528,16 +5098,17 @@ class OCRApp:
             
             for idx, image_path in enumerate(self.image_paths, 1):
                 self.root.after(0, lambda i=idx, p=image_path: 
-                    self.progress_label.config(text=f"正在处理: {i}/{total} - {os.path.basename(p)}"))
+                    self.progress_label.config(text=f"正在处理: {i}/{total} - {ocr_source_name(p)}"))
                 
                 self.root.after(0, lambda: self.result_text.insert(tk.END, f"\n{'='*80}\n"))
                 self.root.after(0, lambda i=idx, p=image_path: 
-                    self.result_text.insert(tk.END, f"文件 {i}/{total}: {os.path.basename(p)}\n"))
+                    self.result_text.insert(tk.END, f"文件 {i}/{total}: {ocr_source_name(p)}\n"))
                 self.root.after(0, lambda: self.result_text.insert(tk.END, f"{'='*80}\n"))
                 
+                ocr_source, offset, size = image_path, (0, 0), None
                 try:
-                    img = Image.open(image_path)
-                    width, height = img.size
+                    ocr_source, offset, size = self._prepare_ocr_source(image_path, 'accurate')
+                    width, height = size
                     
                     unlock_status = " [已解锁]" if self.size_limit_unlocked else ""
                     self.root.after(0, lambda w=width, h=height, u=unlock_status: 
@@ -3545,22 +5116,22 @@ class OCRApp:
                     
                     # 检查是否符合高精度识别要求
                     if not self.size_limit_unlocked:
-                        width_in_accurate = self.size_limits["accurate_min_width"] <= width <= self.size_limits["accurate_max_width"]
-                        height_in_accurate = self.size_limits["accurate_min_height"] <= height <= self.size_limits["accurate_max_height"]
+                        width_in_accurate = width >= self.size_limits["accurate_min_width"]
+                        height_in_accurate = height >= self.size_limits["accurate_min_height"]
                         meets_accurate = width_in_accurate and height_in_accurate
                         
                         if not meets_accurate:
-                            acc_w_range = f"{self.size_limits['accurate_min_width']}~{self.size_limits['accurate_max_width']}"
-                            acc_h_range = f"{self.size_limits['accurate_min_height']}~{self.size_limits['accurate_max_height']}"
+                            acc_w_range = self.size_limits['accurate_min_width']
+                            acc_h_range = self.size_limits['accurate_min_height']
                             self.root.after(0, lambda w=width, h=height, wr=acc_w_range, hr=acc_h_range: 
                                 self.result_text.insert(tk.END, 
                                     f"⚠️ 跳过：图片尺寸不符合要求\n"
                                     f"   当前尺寸: {w}x{h}\n"
-                                    f"   要求：宽度({wr})且高度({hr})都要在范围内\n"
+                                    f"   要求：宽度不小于 {wr} 且高度不小于 {hr}（超出上限的图片会自动分块识别）\n"
                                     f"   建议使用「快速识别」按钮或点击「解锁限制」\n"))
                             
                             self.all_results.append({
-                                'file': os.path.basename(image_path),
+                                'file': ocr_source_name(image_path),
                                 'path': image_path,
                                 'lines': [],
                                 'count': 0,
@@ -3575,11 +5146,11 @@ class OCRApp:
                     self.root.after(0, lambda err=str(e): 
                         self.result_text.insert(tk.END, f"⚠️ 无法读取图片尺寸: {err}\n"))
                 
-                result = ocr_image(image_path)
+                result = self.recognize('accurate', ocr_source, offset, size)
                 
                 if "words_result" in result:
                     formatted_lines = []
-                    for item in result["words_result"]:
+                    for item in self.order_ocr_lines(image_path, result["words_result"]):
                         words = item["words"]
                         location = item.get("location", {})
                         top = location.get("top", 0)
@@ -3592,7 +5163,7 @@ class OCRApp:
                         self.result_text.insert(tk.END, t + "\n"))
                     
                     self.all_results.append({
-                        'file': os.path.basename(image_path),
+                        'file': ocr_source_name(image_path),
                         'path': image_path,
                         'lines': formatted_lines,
                         'count': len(formatted_lines)
@@ -3604,7 +5175,7 @@ class OCRApp:
                     self.root.after(0, lambda r=result: 
                         self.result_text.insert(tk.END, f"✗ 识别失败：{r}\n"))
                     self.all_results.append({
-                        'file': os.path.basename(image_path),
+                        'file': ocr_source_name(image_path),
                         'path': image_path,
                         'lines': [],
                         'count': 0,
@@ -3695,37 +5266,38 @@ class OCRApp:
             
             for idx, image_path in enumerate(self.image_paths, 1):
                 self.root.after(0, lambda i=idx, p=image_path: 
-                    self.progress_label.config(text=f"通用识别中: {i}/{total} - {os.path.basename(p)}"))
+                    self.progress_label.config(text=f"通用识别中: {i}/{total} - {ocr_source_name(p)}"))
                 
                 self.root.after(0, lambda: self.result_text.insert(tk.END, f"\n{'='*80}\n"))
                 self.root.after(0, lambda i=idx, p=image_path: 
-                    self.result_text.insert(tk.END, f"文件 {i}/{total}: {os.path.basename(p)}\n"))
+                    self.result_text.insert(tk.END, f"文件 {i}/{total}: {ocr_source_name(p)}\n"))
                 self.root.after(0, lambda: self.result_text.insert(tk.END, f"{'='*80}\n"))
                 
+                ocr_source, offset, size = image_path, (0, 0), None
                 try:
-                    img = Image.open(image_path)
-                    width, height = img.size
+                    ocr_source, offset, size = self._prepare_ocr_source(image_path, 'general')
+                    width, height = size
                     
                     self.root.after(0, lambda w=width, h=height: 
                         self.result_text.insert(tk.END, f"图片尺寸: 宽{w} x 高{h}\n"))
                     
                     # 检查是否符合通用识别要求
-                    width_in_general = self.size_limits["general_min_width"] <= width <= self.size_limits["general_max_width"]
-                    height_in_general = self.size_limits["general_min_height"] <= height <= self.size_limits["general_max_height"]
+                    width_in_general = width >= self.size_limits["general_min_width"]
+                    height_in_general = height >= self.size_limits["general_min_height"]
                     meets_general = width_in_general and height_in_general
                     
                     if not meets_general:
-                        gen_w_range = f"{self.size_limits['general_min_width']}~{self.size_limits['general_max_width']}"
-                        gen_h_range = f"{self.size_limits['general_min_height']}~{self.size_limits['general_max_height']}"
+                        gen_w_range = self.size_limits['general_min_width']
+                        gen_h_range = self.size_limits['general_min_height']
                         self.root.after(0, lambda w=width, h=height, wr=gen_w_range, hr=gen_h_range: 
                             self.result_text.insert(tk.END, 
                                 f"⚠️ 跳过：图片尺寸不符合要求\n"
                                 f"   当前尺寸: 宽{w} x 高{h}\n"
-                                f"   要求：宽度({wr})且高度({hr})都要在范围内\n"
+                                f"   要求：宽度不小于 {wr} 且高度不小于 {hr}（超出上限的图片会自动分块识别）\n"
                                 f"   建议使用其他识别模式\n"))
                         
                         self.all_results.append({
-                            'file': os.path.basename(image_path),
+                            'file': ocr_source_name(image_path),
                             'path': image_path,
                             'lines': [],
                             'count': 0,
@@ -3740,11 +5312,11 @@ class OCRApp:
                     self.root.after(0, lambda err=str(e): 
                         self.result_text.insert(tk.END, f"⚠️ 无法读取图片尺寸: {err}\n"))
                 
-                result = ocr_image_general(image_path)
+                result = self.recognize('general', ocr_source, offset, size)
                 
                 if "words_result" in result:
                     formatted_lines = []
-                    for item in result["words_result"]:
+                    for item in self.order_ocr_lines(image_path, result["words_result"]):
                         words = item["words"]
                         location = item.get("location", {})
                         top = location.get("top", 0)
@@ -3757,7 +5329,7 @@ class OCRApp:
                         self.result_text.insert(tk.END, t + "\n"))
                     
                     self.all_results.append({
-                        'file': os.path.basename(image_path),
+                        'file': ocr_source_name(image_path),
                         'path': image_path,
                         'lines': formatted_lines,
                         'count': len(formatted_lines)
@@ -3769,7 +5341,7 @@ class OCRApp:
                     self.root.after(0, lambda r=result: 
                         self.result_text.insert(tk.END, f"✗ 识别失败：{r}\n"))
                     self.all_results.append({
-                        'file': os.path.basename(image_path),
+                        'file': ocr_source_name(image_path),
                         'path': image_path,
                         'lines': [],
                         'count': 0,
@@ -3851,37 +5423,38 @@ class OCRApp:
             
             for idx, image_path in enumerate(self.image_paths, 1):
                 self.root.after(0, lambda i=idx, p=image_path: 
-                    self.progress_label.config(text=f"快速识别中: {i}/{total} - {os.path.basename(p)}"))
+                    self.progress_label.config(text=f"快速识别中: {i}/{total} - {ocr_source_name(p)}"))
                 
                 self.root.after(0, lambda: self.result_text.insert(tk.END, f"\n{'='*80}\n"))
                 self.root.after(0, lambda i=idx, p=image_path: 
-                    self.result_text.insert(tk.END, f"文件 {i}/{total}: {os.path.basename(p)}\n"))
+                    self.result_text.insert(tk.END, f"文件 {i}/{total}: {ocr_source_name(p)}\n"))
                 self.root.after(0, lambda: self.result_text.insert(tk.END, f"{'='*80}\n"))
                 
+                ocr_source, offset, size = image_path, (0, 0), None
                 try:
-                    img = Image.open(image_path)
-                    width, height = img.size
+                    ocr_source, offset, size = self._prepare_ocr_source(image_path, 'basic')
+                    width, height = size
                     
                     self.root.after(0, lambda w=width, h=height: 
                         self.result_text.insert(tk.END, f"图片尺寸: 宽{w} x 高{h}\n"))
                     
                     # 检查是否符合快速识别要求
-                    width_in_basic = self.size_limits["basic_min_width"] <= width <= self.size_limits["basic_max_width"]
-                    height_in_basic = self.size_limits["basic_min_height"] <= height <= self.size_limits["basic_max_height"]
+                    width_in_basic = width >= self.size_limits["basic_min_width"]
+                    height_in_basic = height >= self.size_limits["basic_min_height"]
                     meets_basic = width_in_basic and height_in_basic
                     
                     if not meets_basic:
-                        bas_w_range = f"{self.size_limits['basic_min_width']}~{self.size_limits['basic_max_width']}"
-                        bas_h_range = f"{self.size_limits['basic_min_height']}~{self.size_limits['basic_max_height']}"
+                        bas_w_range = self.size_limits['basic_min_width']
+                        bas_h_range = self.size_limits['basic_min_height']
                         self.root.after(0, lambda w=width, h=height, wr=bas_w_range, hr=bas_h_range: 
                             self.result_text.insert(tk.END, 
                                 f"⚠️ 跳过：图片尺寸不符合要求\n"
                                 f"   当前尺寸: 宽{w} x 高{h}\n"
-                                f"   要求：宽度({wr})且高度({hr})都要在范围内\n"
+                                f"   要求：宽度不小于 {wr} 且高度不小于 {hr}（超出上限的图片会自动分块识别）\n"
                                 f"   建议使用「高精度识别」按钮\n"))
                         
                         self.all_results.append({
-                            'file': os.path.basename(image_path),
+                            'file': ocr_source_name(image_path),
                             'path': image_path,
                             'lines': [],
                             'count': 0,
@@ -3896,11 +5469,11 @@ class OCRApp:
                     self.root.after(0, lambda err=str(e): 
                         self.result_text.insert(tk.END, f"⚠️ 无法读取图片尺寸: {err}\n"))
                 
-                result = ocr_image_basic(image_path)
+                result = self.recognize('basic', ocr_source, offset, size)
                 
                 if "words_result" in result:
                     text_only_lines = []
-                    for item in result["words_result"]:
+                    for item in self.order_ocr_lines(image_path, result["words_result"]):
                         words = item["words"]
                         text_only_lines.append(words)
                     
@@ -3909,7 +5482,7 @@ class OCRApp:
                         self.result_text.insert(tk.END, t + "\n"))
                     
                     self.all_results.append({
-                        'file': os.path.basename(image_path),
+                        'file': ocr_source_name(image_path),
                         'path': image_path,
                         'lines': text_only_lines,
                         'count': len(text_only_lines)
@@ -3921,7 +5494,7 @@ class OCRApp:
                     self.root.after(0, lambda r=result: 
                         self.result_text.insert(tk.END, f"✗ 识别失败：{r}\n"))
                     self.all_results.append({
-                        'file': os.path.basename(image_path),
+                        'file': ocr_source_name(image_path),
                         'path': image_path,
                         'lines': [],
                         'count': 0,
@@ -4272,6 +5845,15 @@ class OCRApp:
         """窗口关闭时的处理"""
         # 保存窗口配置
         self.save_window_config()
+        # 保存分类会话：先等后台自动保存写完，再同步保存剩余改动，避免中途退出或同时写同一个临时文件
+        if self.session_save_thread is not None:
+            self.session_save_thread.join()
+        if self.session_dirty():
+            try:
+                save_classifier_session(self.session_file, self.df, self._session_state())
+                print(f"✓ 分类会话已保存: {self.session_file.name}")
+            except Exception as e:
+                print(f"⚠️ 保存分类会话失败: {e}")
         # 关闭窗口
         self.root.destroy()
     
@@ -4454,6 +6036,7 @@ class OCRApp:
             config = self.store.get('font_style_rules', {})
             if config:
                 self.font_style_rules = config
+                self.font_style_trie.rebuild(self.font_style_rules)
                 print(f"✓ 已加载字体样式配置: {len(self.font_style_rules)} 个规则")
             else:
                 # 创建默认字体样式规则
@@ -4471,9 +6054,12 @@ class OCRApp:
         except Exception as e:
             print(f"⚠️ 加载字体样式配置失败: {e}")
             self.font_style_rules = {}
+            self.font_style_trie.rebuild(self.font_style_rules)
     
     def save_font_style_config(self):
         """保存字体样式配置"""
+        # 规则有变化时重新编译前缀树
+        self.font_style_trie.rebuild(self.font_style_rules)
         try:
             self.store.set('font_style_rules', self.font_style_rules)
             print(f"✓ 字体样式配置已保存: {len(self.font_style_rules)} 个规则")
@@ -5549,31 +7135,27 @@ class OCRApp:
             return
         
         try:
-            # 加载所有图片
-            images = []
-            for path in file_paths:
-                img = Image.open(path)
-                images.append(img)
+            # 只读文件头获取尺寸，粘贴时再逐张解码
+            sizes = [image_size(path) for path in file_paths]
             
             # 计算拼接后的尺寸
-            total_width = sum(img.width for img in images)
-            max_height = max(img.height for img in images)
+            total_width = sum(w for w, h in sizes)
+            max_height = max(h for w, h in sizes)
             
-            # 创建拼接图片
-            merged_image = Image.new('RGB', (total_width, max_height), 'white')
+            # 创建拼接图片（磁盘映射画布，逐张粘贴）
+            merged_image = StripMergeCanvas(total_width, max_height)
             
-            # 从右到左拼接（默认）
-            x_offset = 0
-            for img in reversed(images):
-                y_offset = (max_height - img.height) // 2
-                merged_image.paste(img, (x_offset, y_offset))
-                x_offset += img.width
+            # 从右到左拼接（默认），并记录布局供识别后恢复阅读顺序
+            layout = right_to_left_layout(sizes, [os.path.basename(p) for p in file_paths])
+            for path, src in zip(file_paths, layout['sources']):
+                with Image.open(path) as img:
+                    merged_image.paste(img, (src['x'], src['y']))
             
             # 询问是否保存
             save_choice = messagebox.askyesnocancel(
                 "拼接完成",
                 f"拼接完成！\n\n"
-                f"图片数量: {len(images)}\n"
+                f"图片数量: {len(file_paths)}\n"
                 f"拼接尺寸: {total_width}x{max_height}\n\n"
                 f"是否保存拼接后的图片？\n\n"
                 f"「是」= 保存图片并识别\n"
@@ -5584,18 +7166,15 @@ class OCRApp:
             if save_choice is None:  # 取消
                 return
             
-            # 保存到临时文件（用于识别）
-            import tempfile
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, "merged_temp.jpg")
-            merged_image.save(temp_path, format='JPEG', quality=90)
+            # 识别来源的名称；确认识别并选定模式后才编码
+            source_name = f"拼接图片_{len(file_paths)}张_{total_width}x{max_height}.jpg"
             
             # 如果选择保存
             if save_choice:
                 save_path = filedialog.asksaveasfilename(
                     defaultextension=".jpg",
                     filetypes=[("JPEG图片", "*.jpg"), ("PNG图片", "*.png"), ("所有文件", "*.*")],
-                    initialfile=f"merged_{len(images)}images_{total_width}x{max_height}.jpg"
+                    initialfile=f"merged_{len(file_paths)}images_{total_width}x{max_height}.jpg"
                 )
                 
                 if save_path:
@@ -5608,8 +7187,8 @@ class OCRApp:
                     self.progress_label.config(
                         text=f"✓ 拼接图片已保存到：{os.path.basename(save_path)}")
                     
-                    # 使用保存的文件进行识别
-                    temp_path = save_path
+                    # 识别仍使用内存中的编码结果，只更新显示名称
+                    source_name = os.path.basename(save_path)
             
             # 继续识别流程
             result = messagebox.askyesno("开始识别", 
@@ -5617,19 +7196,13 @@ class OCRApp:
                 f"拼接尺寸: {total_width}x{max_height}")
             
             if result:
-                self.image_paths = [temp_path]
                 self.file_label.config(
-                    text=f"已选择: 拼接图片 ({len(images)}张) - {total_width}x{max_height}", 
+                    text=f"已选择: 拼接图片 ({len(file_paths)}张) - {total_width}x{max_height}", 
                     fg="blue")
                 
-                # 检查尺寸并启用相应按钮（宽度和高度都在范围内）
-                width_in_accurate = self.size_limits["accurate_min_width"] <= total_width <= self.size_limits["accurate_max_width"]
-                height_in_accurate = self.size_limits["accurate_min_height"] <= max_height <= self.size_limits["accurate_max_height"]
-                meets_accurate = width_in_accurate and height_in_accurate
-                
-                width_in_basic = self.size_limits["basic_min_width"] <= total_width <= self.size_limits["basic_max_width"]
-                height_in_basic = self.size_limits["basic_min_height"] <= max_height <= self.size_limits["basic_max_height"]
-                meets_basic = width_in_basic and height_in_basic
+                # 检查尺寸并启用相应按钮（只看下限，超出上限的拼接图识别时自动分块）
+                meets_accurate = total_width >= self.size_limits["accurate_min_width"] and max_height >= self.size_limits["accurate_min_height"]
+                meets_basic = total_width >= self.size_limits["basic_min_width"] and max_height >= self.size_limits["basic_min_height"]
                 
                 if meets_accurate:
                     self.ocr_btn.config(state=tk.NORMAL)
@@ -5650,19 +7223,19 @@ class OCRApp:
                         f"「是」= 高精度识别\n"
                         f"「否」= 快速识别")
                     if ocr_choice:
-                        self.root.after(500, self.perform_ocr)
+                        self._start_merged_ocr([(merged_image, source_name, layout)], 'accurate')
                     else:
-                        self.root.after(500, self.perform_quick_ocr)
+                        self._start_merged_ocr([(merged_image, source_name, layout)], 'basic')
                 elif meets_accurate:
-                    self.root.after(500, self.perform_ocr)
+                    self._start_merged_ocr([(merged_image, source_name, layout)], 'accurate')
                 elif meets_basic:
-                    self.root.after(500, self.perform_quick_ocr)
+                    self._start_merged_ocr([(merged_image, source_name, layout)], 'basic')
                 else:
                     messagebox.showwarning("警告", 
-                        f"拼接后的图片尺寸不符合任何识别要求\n\n"
+                        f"拼接后的图片尺寸不足，无法识别\n\n"
                         f"当前尺寸: {total_width}x{max_height}\n"
                         f"高精度要求: 宽≥{self.size_limits['accurate_min_width']} 且 高≥{self.size_limits['accurate_min_height']}\n"
-                        f"快速识别要求: 宽<{self.size_limits['basic_max_width']} 且 高<{self.size_limits['basic_max_height']}")
+                        f"快速识别要求: 宽≥{self.size_limits['basic_min_width']} 且 高≥{self.size_limits['basic_min_height']}")
         
         except Exception as e:
             messagebox.showerror("错误", f"拼接失败：{str(e)}")
@@ -5679,6 +7252,193 @@ class OCRApp:
         
         self._open_crop_window(file_paths)
     
+    def save_crop_template(self, name, regions):
+        """保存命名裁剪模板（相对坐标）"""
+        templates = self.store.get('crop_templates', {})
+        templates[name] = regions
+        self.store.set('crop_templates', templates)
+        print(f"✓ 已保存裁剪模板: {name}（{len(regions)} 个区域）")
+    
+    def choose_crop_template(self, parent):
+        """弹出模板选择对话框，返回模板名称，取消时返回 None"""
+        templates = self.store.get('crop_templates', {})
+        if not templates:
+            messagebox.showinfo("提示", "还没有保存任何裁剪模板！\n\n请先在裁剪窗口中框选区域并「存为模板」", parent=parent)
+            return None
+        
+        dialog = tk.Toplevel(parent)
+        dialog.title("选择裁剪模板")
+        dialog.transient(parent)
+        dialog.grab_set()
+        
+        tk.Label(dialog, text="裁剪模板：", font=("Arial", 11)).pack(padx=20, pady=(15, 5))
+        names = sorted(templates)
+        name_var = tk.StringVar(value=names[0])
+        ttk.Combobox(dialog, textvariable=name_var, values=names, state="readonly", width=30).pack(padx=20, pady=5)
+        
+        choice = [None]
+        
+        def on_ok():
+            choice[0] = name_var.get()
+            dialog.destroy()
+        
+        btn_frame = tk.Frame(dialog)
+        btn_frame.pack(pady=15)
+        tk.Button(btn_frame, text="确定", command=on_ok, bg="#4CAF50", fg="white",
+                 padx=20).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="取消", command=dialog.destroy, bg="#757575", fg="white",
+                 padx=20).pack(side=tk.LEFT, padx=5)
+        
+        parent.wait_window(dialog)
+        return choice[0]
+    
+    def run_template_batch(self):
+        """把裁剪模板套用到整个文件夹：后台并行完成裁剪、拼接和识别，不打开裁剪窗口"""
+        template_name = self.choose_crop_template(self.root)
+        if not template_name:
+            return
+        
+        folder = filedialog.askdirectory(title="选择要批量处理的图片文件夹")
+        if not folder:
+            return
+        
+        files = sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                       if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+        if not files:
+            messagebox.showwarning("警告", "文件夹中没有图片文件！")
+            return
+        
+        if not API_KEY or not SECRET_KEY:
+            messagebox.showerror("错误", "请先在 .env 文件中配置 API_KEY 和 SECRET_KEY！")
+            return
+        
+        regions = self.store.get('crop_templates', {})[template_name]
+        self.ocr_btn.config(state=tk.DISABLED)
+        self.quick_ocr_btn.config(state=tk.DISABLED)
+        self.general_ocr_btn.config(state=tk.DISABLED)
+        self.select_btn.config(state=tk.DISABLED)
+        
+        thread = threading.Thread(target=self._template_batch_thread,
+                                  args=(template_name, regions, files), daemon=True)
+        thread.start()
+    
+    def ocr_regions(self, regions, open_image, modes=('general', 'accurate')):
+        """区域识别：只上传框选区域，小区域装箱进尽量少的请求（可跨图片共享），识别坐标映射回原图
+
+        regions 为 (图片路径, 像素框) 列表，open_image(路径) 返回解码后的原图；
+        只在返回位置信息的模式中选择。返回与 regions 对应的识别项列表。
+        """
+        boxes = [box for _, box in regions]
+        sizes = [(x2 - x1, y2 - y1) for x1, y1, x2, y2 in boxes]
+        mode, layouts = self.plan_merge_pages(sizes, modes=modes)
+        
+        per_region = [[] for _ in regions]
+        for layout in layouts:
+            merged = StripMergeCanvas(layout['width'], layout['height'])
+            for src in layout['sources']:
+                path, box = regions[src['index']]
+                merged.paste(open_image(path).crop(box), (src['x'], src['y']))
+            result = OCR_FUNCTIONS[mode](MemoryImage.encode(merged, f"区域识别_{len(layout['sources'])}个区域.jpg",
+                                                            OCR_MAX_FILE_SIZE_MB[mode]))
+            if "words_result" not in result:
+                raise RuntimeError(f"识别失败：{result}")
+            for idx, item in remap_ocr_locations(result["words_result"], layout, boxes):
+                per_region[idx].append(item)
+        return per_region
+    
+    def _process_template_file(self, path, regions):
+        """按模板裁剪单个文件并做区域识别，返回与 all_results 相同格式的结果（坐标为原图坐标）"""
+        img = decode_image(path)
+        boxes = template_to_boxes(regions, img.size)
+        per_region = self.ocr_regions([(path, box) for box in boxes], lambda _: img)
+        lines = format_ocr_lines('accurate', [item for items in per_region for item in items])
+        return {'file': os.path.basename(path), 'path': path, 'lines': lines, 'count': len(lines)}
+    
+    def _show_region_results(self, results, history_type):
+        """在结果区按文件输出区域识别结果，并加入历史记录（在后台线程中调用）"""
+        self.all_results = results
+        total = len(results)
+        for idx, r in enumerate(results, 1):
+            if r.get('error'):
+                body = f"✗ 识别失败：{r['error']}\n"
+            else:
+                body = "\n".join(r['lines']) + f"\n\n✓ 识别成功：{r['count']} 行文字\n"
+            text = f"\n{'='*80}\n文件 {idx}/{total}: {r['file']}\n{'='*80}\n{body}"
+            self.root.after(0, lambda t=text: self.result_text.insert(tk.END, t))
+        
+        results_copy = [r.copy() for r in results]
+        self.root.after(0, lambda: self.add_to_history(history_type, results_copy))
+        self.root.after(0, lambda: self.export_btn.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.copy_btn.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.add_zeros_btn.config(state=tk.NORMAL))
+    
+    def _enable_ocr_buttons(self):
+        self.root.after(0, lambda: self.ocr_btn.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.quick_ocr_btn.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.general_ocr_btn.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.select_btn.config(state=tk.NORMAL))
+    
+    def _roi_ocr_thread(self, regions):
+        """区域识别线程：所有框选区域共享请求，结果按原图分组输出"""
+        try:
+            per_region = self.ocr_regions(regions, self.image_cache.open)
+            results = []
+            for path in dict.fromkeys(path for path, _ in regions):
+                items = [item for (p, _), region_items in zip(regions, per_region) if p == path
+                         for item in region_items]
+                lines = format_ocr_lines('accurate', items)
+                results.append({'file': os.path.basename(path), 'path': path, 'lines': lines, 'count': len(lines)})
+            
+            self.root.after(0, lambda: self.result_text.delete(1.0, tk.END))
+            self._show_region_results(results, '区域识别')
+            self.root.after(0, lambda: self.progress_label.config(
+                text=f"✓ 完成！共识别 {len(regions)} 个区域（坐标已换算为原图坐标）"))
+        
+        except Exception as e:
+            self.root.after(0, lambda: self.result_text.insert(tk.END, f"\n发生错误：{str(e)}\n"))
+            self.root.after(0, lambda: messagebox.showerror("错误", f"发生错误：{str(e)}"))
+            self.root.after(0, lambda: self.progress_label.config(text="✗ 处理失败"))
+        
+        finally:
+            # 裁剪窗口已关闭，识别期间重新解码的原图不再需要
+            self.image_cache.clear()
+            self._enable_ocr_buttons()
+    
+    def _template_batch_thread(self, template_name, regions, files):
+        """模板批量识别线程：线程池并行对各文件做区域识别，结果按文件顺序输出"""
+        try:
+            self.root.after(0, lambda: self.result_text.delete(1.0, tk.END))
+            total = len(files)
+            results = [None] * total
+            done = 0
+            
+            with ThreadPoolExecutor(max_workers=self.store.get('batch_workers', 3)) as pool:
+                futures = {pool.submit(self._process_template_file, path, regions): idx
+                           for idx, path in enumerate(files)}
+                for future in as_completed(futures):
+                    idx = futures[future]
+                    try:
+                        results[idx] = future.result()
+                    except Exception as e:
+                        results[idx] = {'file': os.path.basename(files[idx]), 'path': files[idx],
+                                        'lines': [], 'count': 0, 'error': str(e)}
+                    done += 1
+                    self.root.after(0, lambda d=done, name=results[idx]['file']:
+                        self.progress_label.config(text=f"模板「{template_name}」批量处理: {d}/{total} - {name}"))
+            
+            self._show_region_results(results, f'模板批量识别（{template_name}）')
+            success_count = sum(1 for r in results if r['count'] > 0)
+            self.root.after(0, lambda: self.progress_label.config(
+                text=f"✓ 完成！模板「{template_name}」共处理 {total} 个文件，成功 {success_count} 个"))
+        
+        except Exception as e:
+            self.root.after(0, lambda: self.result_text.insert(tk.END, f"\n发生错误：{str(e)}\n"))
+            self.root.after(0, lambda: messagebox.showerror("错误", f"发生错误：{str(e)}"))
+            self.root.after(0, lambda: self.progress_label.config(text="✗ 处理失败"))
+        
+        finally:
+            self._enable_ocr_buttons()
+    
     def _open_crop_window(self, file_paths):
         """打开裁剪窗口"""
         crop_window = tk.Toplevel(self.root)
@@ -5696,37 +7456,94 @@ class OCRApp:
         crop_window.state('zoomed')
         
         try:
+            # 打开时只读尺寸，切换到某张图片时才解码
             images_data = []
             for path in file_paths:
-                img = Image.open(path)
                 images_data.append({
                     'path': path,
                     'name': os.path.basename(path),
-                    'original': img,
+                    'size': image_size(path),
                     'crop_areas': []
                 })
             
             display_mode = ['dual' if len(images_data) >= 2 else 'single']
             current_image_index = [0]
             
+            def on_crop_window_destroy(event):
+                """窗口关闭后释放图块、金字塔和解码缓存（区域识别线程需要时会重新解码，结束后再清空）"""
+                if event.widget is not crop_window:
+                    return
+                for img_data in images_data:
+                    img_data.pop('layer', None)
+                self.image_cache.clear()
+            
+            crop_window.bind("<Destroy>", on_crop_window_destroy, add="+")
+            
             max_display_size = min(window_width - 100, window_height - 300)
             
-            def get_display_image(img, is_dual_mode=False):
+            def get_base_scale(size, is_dual_mode=False):
                 max_width = (max_display_size // 2 - 20) if is_dual_mode else max_display_size
                 max_height = max_display_size
+                img_width, img_height = size
                 
-                if img.width > max_width or img.height > max_height:
-                    scale = min(max_width / img.width, max_height / img.height)
-                    new_width = int(img.width * scale)
-                    new_height = int(img.height * scale)
-                    display_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    return display_img, scale
-                return img.copy(), 1.0
+                if img_width > max_width or img_height > max_height:
+                    return min(max_width / img_width, max_height / img_height)
+                return 1.0
+            
+            def get_image_layer(img_data):
+                """每张图片一个金字塔与分块图层，切换模式和缩放时复用"""
+                if 'layer' not in img_data:
+                    img_data['layer'] = TiledImageLayer(canvas, ImagePyramid(img_data['path'], self.image_cache, img_data['size']),
+                                                        tag="tiles")
+                return img_data['layer']
+            
+            def active_layers():
+                return [info['data']['layer'] for info in getattr(canvas, 'image_info', [])]
+            
+            def render_visible_tiles(preview=False):
+                render_pending[0] = None
+                if not canvas.winfo_exists():
+                    return
+                for layer in active_layers():
+                    layer.render(preview)
+                if preview:
+                    schedule_refine()
+            
+            def schedule_tile_render():
+                """滚动、平移、窗口变化时先补齐预览图块"""
+                if render_pending[0] is None:
+                    render_pending[0] = canvas.after_idle(lambda: render_visible_tiles(preview=True))
+            
+            def schedule_refine(delay=200):
+                """交互停止 delay 毫秒后再做高质量渲染；新的交互会作废尚未完成的渲染"""
+                refine_state['generation'] += 1
+                if refine_state['job'] is not None:
+                    canvas.after_cancel(refine_state['job'])
+                generation = refine_state['generation']
+                refine_state['job'] = canvas.after(delay, lambda: refine_tiles(generation))
+            
+            def refine_tiles(generation):
+                refine_state['job'] = None
+                if generation != refine_state['generation'] or not canvas.winfo_exists():
+                    return
+                # 每次只替换一个图块，保持界面响应
+                if any(layer.refine_step() for layer in active_layers()):
+                    refine_state['job'] = canvas.after(1, lambda: refine_tiles(generation))
+            
+            def on_xview(*args):
+                h_scrollbar.set(*args)
+                schedule_tile_render()
+            
+            def on_yview(*args):
+                v_scrollbar.set(*args)
+                schedule_tile_render()
             
             current_rect = None
             start_x = start_y = 0
             zoom_level = [1.0]
             is_panning = [False]
+            render_pending = [None]
+            refine_state = {'generation': 0, 'job': None}
             
             title_frame = tk.Frame(crop_window, bg="#FF9800")
             title_frame.pack(fill=tk.X)
@@ -5753,9 +7570,10 @@ class OCRApp:
             v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
             
             canvas = tk.Canvas(canvas_frame, bg="gray", cursor="cross",
-                             xscrollcommand=h_scrollbar.set,
-                             yscrollcommand=v_scrollbar.set)
+                             xscrollcommand=on_xview,
+                             yscrollcommand=on_yview)
             canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            canvas.bind("<Configure>", lambda e: schedule_tile_render())
             
             h_scrollbar.config(command=canvas.xview)
             v_scrollbar.config(command=canvas.yview)
@@ -5796,10 +7614,13 @@ class OCRApp:
                     merge_text += f"  |  已用: {usage_percent:.1f}%"
                     
                     if total_width > self.size_limits["basic_max_width"]:
-                        merge_text += f"  |  ❌ 超限 {total_width - 8100}px"
-                        merge_info_label.config(text=merge_text, fg="red")
-                        merge_info_frame.config(bg="#ffe0e0")
-                        merge_info_label.config(bg="#ffe0e0")
+                        crop_sizes = [(x2 - x1, y2 - y1) for img_data in images_data
+                                      for (x1, y1, x2, y2) in (area['coords'] for area in img_data['crop_areas'])]
+                        mode, pages = self.plan_merge_pages(crop_sizes)
+                        merge_text += f"  |  📦 超出单行宽度，将自动分行装箱为 {len(pages)} 张合成图"
+                        merge_info_label.config(text=merge_text, fg="#ff6600")
+                        merge_info_frame.config(bg="#fff3e0")
+                        merge_info_label.config(bg="#fff3e0")
                     elif total_width > 7000:
                         merge_text += f"  |  ⚠️ 剩余 {remaining_width}px"
                         merge_info_label.config(text=merge_text, fg="#ff6600")
@@ -5816,45 +7637,34 @@ class OCRApp:
                     merge_info_frame.config(bg="#f0f0f0")
                     merge_info_label.config(bg="#f0f0f0")
             
-            def display_current_image():
-                """显示当前图片"""
+            def display_current_image(preview=False):
+                """显示当前图片；preview 为 True 时先显示快速预览，稍后再高质量渲染"""
                 canvas.delete("all")
-                from PIL import ImageTk
                 
                 if display_mode[0] == 'dual' and len(images_data) >= 2:
                     img1_data = images_data[0]
                     img2_data = images_data[1]
                     
-                    base_img1, base_scale1 = get_display_image(img1_data['original'], is_dual_mode=True)
-                    base_img2, base_scale2 = get_display_image(img2_data['original'], is_dual_mode=True)
+                    base_scale1 = get_base_scale(img1_data['size'], is_dual_mode=True)
+                    base_scale2 = get_base_scale(img2_data['size'], is_dual_mode=True)
                     
                     final_scale1 = base_scale1 * zoom_level[0]
                     final_scale2 = base_scale2 * zoom_level[0]
                     
-                    final_width1 = int(img1_data['original'].width * final_scale1)
-                    final_height1 = int(img1_data['original'].height * final_scale1)
-                    final_width2 = int(img2_data['original'].width * final_scale2)
-                    final_height2 = int(img2_data['original'].height * final_scale2)
-                    
-                    display_img1 = img1_data['original'].resize((final_width1, final_height1), Image.Resampling.LANCZOS)
-                    display_img2 = img2_data['original'].resize((final_width2, final_height2), Image.Resampling.LANCZOS)
-                    
+                    # 图片只按视口分块渲染，这里只挂载图层并计算显示尺寸
                     gap = 20
+                    final_width1, final_height1 = get_image_layer(img1_data).attach(final_scale1, 0)
+                    x_offset = final_width1 + gap
+                    final_width2, final_height2 = get_image_layer(img2_data).attach(final_scale2, x_offset)
+                    
                     total_width = final_width1 + gap + final_width2
                     total_height = max(final_height1, final_height2)
                     
                     canvas.config(scrollregion=(0, 0, total_width, total_height))
                     
-                    photo1 = ImageTk.PhotoImage(display_img1)
-                    canvas.photo1 = photo1
-                    canvas.create_image(0, 0, anchor=tk.NW, image=photo1, tags="image1")
                     canvas.create_text(final_width1 // 2, 20, text=f"图1: {img1_data['name']}", 
                                      font=("Arial", 12, "bold"), fill="yellow", tags="label1")
                     
-                    x_offset = final_width1 + gap
-                    photo2 = ImageTk.PhotoImage(display_img2)
-                    canvas.photo2 = photo2
-                    canvas.create_image(x_offset, 0, anchor=tk.NW, image=photo2, tags="image2")
                     canvas.create_text(x_offset + final_width2 // 2, 20, text=f"图2: {img2_data['name']}", 
                                      font=("Arial", 12, "bold"), fill="yellow", tags="label2")
                     
@@ -5890,20 +7700,14 @@ class OCRApp:
                 
                 else:
                     current_img = images_data[current_image_index[0]]
-                    base_display_img, base_scale = get_display_image(current_img['original'], is_dual_mode=False)
+                    base_scale = get_base_scale(current_img['size'], is_dual_mode=False)
                     
                     final_scale = base_scale * zoom_level[0]
-                    final_width = int(current_img['original'].width * final_scale)
-                    final_height = int(current_img['original'].height * final_scale)
+                    final_width, final_height = get_image_layer(current_img).attach(final_scale, 0)
                     
-                    display_img = current_img['original'].resize((final_width, final_height), Image.Resampling.LANCZOS)
-                    
-                    photo = ImageTk.PhotoImage(display_img)
-                    canvas.photo = photo
                     canvas.image_info = [{'x_offset': 0, 'scale': final_scale, 'data': current_img}]
                     
                     canvas.config(scrollregion=(0, 0, final_width, final_height))
-                    canvas.create_image(0, 0, anchor=tk.NW, image=photo, tags="image")
                     
                     for i, area in enumerate(current_img['crop_areas']):
                         orig_x1, orig_y1, orig_x2, orig_y2 = area['coords']
@@ -5923,6 +7727,7 @@ class OCRApp:
                     zoom_percent = int(zoom_level[0] * 100)
                     image_label.config(text=f"图片 {current_image_index[0]+1}/{len(images_data)}: {current_img['name']} | 缩放: {zoom_percent}%")
                 
+                render_visible_tiles(preview)
                 update_status()
 
 
@@ -5954,7 +7759,7 @@ class OCRApp:
                             img_data = img_info['data']
                             x_off = img_info['x_offset']
                             scale = img_info['scale']
-                            img_width = img_data['original'].width * scale
+                            img_width = img_data['size'][0] * scale
                             
                             if x_off <= center_x <= x_off + img_width:
                                 target_img = img_data
@@ -5970,10 +7775,11 @@ class OCRApp:
                             orig_x2 = int((max(x1, x2) - x_off) / scale)
                             orig_y2 = int(max(y1, y2) / scale)
                             
-                            orig_x1 = max(0, min(orig_x1, target_img['original'].width))
-                            orig_y1 = max(0, min(orig_y1, target_img['original'].height))
-                            orig_x2 = max(0, min(orig_x2, target_img['original'].width))
-                            orig_y2 = max(0, min(orig_y2, target_img['original'].height))
+                            img_width, img_height = target_img['size']
+                            orig_x1 = max(0, min(orig_x1, img_width))
+                            orig_y1 = max(0, min(orig_y1, img_height))
+                            orig_x2 = max(0, min(orig_x2, img_width))
+                            orig_y2 = max(0, min(orig_y2, img_height))
                             
                             total_areas = sum(len(img['crop_areas']) for img in images_data)
                             
@@ -6042,7 +7848,7 @@ class OCRApp:
                 
                 zoom_level[0] = max(0.1, min(zoom_level[0], 10.0))
                 
-                display_current_image()
+                display_current_image(preview=True)
             
             def on_pan_start(event):
                 """开始平移（中键拖动）"""
@@ -6113,7 +7919,7 @@ class OCRApp:
                 for img_data in images_data:
                     if img_data['crop_areas']:
                         all_crop_areas.extend([
-                            (img_data['original'], area['coords'], img_data['name']) 
+                            (img_data['path'], area['coords'], img_data['name']) 
                             for area in img_data['crop_areas']
                         ])
                 
@@ -6122,37 +7928,26 @@ class OCRApp:
                     return
                 
                 try:
-                    cropped_images = []
-                    for i, (original_img, coords, img_name) in enumerate(all_crop_areas):
-                        x1, y1, x2, y2 = coords
-                        cropped = original_img.crop((x1, y1, x2, y2))
-                        cropped_images.append(cropped)
-                    
-                    total_width = sum(img.width for img in cropped_images)
-                    max_height = max(img.height for img in cropped_images)
-                    
-                    if total_width > self.size_limits["basic_max_width"]:
-                        messagebox.showerror("图片尺寸超限",
-                            f"拼接后的图片宽度超过限制！\n\n"
-                            f"当前宽度: {total_width}px\n"
-                            f"最大宽度: 8100px\n"
-                            f"超出: {total_width - 8100}px")
-                        return
+                    # 区域尺寸直接由坐标得出，粘贴时再逐个裁剪
+                    crop_sizes = [(x2 - x1, y2 - y1) for _, (x1, y1, x2, y2), _ in all_crop_areas]
+                    crop_names = [name for _, _, name in all_crop_areas]
                     
-                    # 根据默认方向拼接图片（从右到左）
-                    merged = Image.new('RGB', (total_width, max_height), 'white')
+                    # 按识别模式的尺寸限制装箱成尽量少的合成图（多行排列），布局即区域映射表
+                    plan_mode, layouts = self.plan_merge_pages(crop_sizes, crop_names)
                     
-                    # 从右到左拼接（默认）
-                    x_offset = 0
-                    for i, img in enumerate(reversed(cropped_images)):
-                        y_offset = (max_height - img.height) // 2
-                        merged.paste(img, (x_offset, y_offset))
-                        x_offset += img.width
+                    pages = []
+                    for page_no, layout in enumerate(layouts, 1):
+                        # 每张合成图使用磁盘映射画布，行内从右到左
+                        merged = StripMergeCanvas(layout['width'], layout['height'])
+                        for src in layout['sources']:
+                            img_path, coords, _ = all_crop_areas[src['index']]
+                            merged.paste(self.image_cache.open(img_path).crop(coords), (src['x'], src['y']))
+                        
+                        # 确认识别并选定模式后才按该模式编码
+                        suffix = f"_{page_no}" if len(layouts) > 1 else ""
+                        pages.append((merged, f"裁剪拼接_{len(layout['sources'])}个区域_{merged.width}x{merged.height}{suffix}.jpg", layout))
                     
-                    import tempfile
-                    temp_dir = tempfile.gettempdir()
-                    temp_path = os.path.join(temp_dir, "cropped_merged_ocr.jpg")
-                    merged.save(temp_path, format='JPEG', quality=90)
+                    page_desc = "、".join(f"{layout['width']}x{layout['height']}" for layout in layouts)
                     
                     crop_window.destroy()
                     
@@ -6177,8 +7972,8 @@ class OCRApp:
                     tk.Label(save_dialog, text="拼接完成！", 
                             font=("Arial", 14, "bold")).pack(pady=15)
                     
-                    info_text = f"区域数量: {len(cropped_images)}\n"
-                    info_text += f"拼接尺寸: 宽{total_width} x 高{max_height}"
+                    info_text = f"区域数量: {len(all_crop_areas)}\n"
+                    info_text += f"合成图: {len(layouts)} 张（{page_desc}）"
                     tk.Label(save_dialog, text=info_text, 
                             font=("Arial", 11)).pack(pady=10)
                     
@@ -6228,15 +8023,18 @@ class OCRApp:
                                 ("PNG图片", "*.png"),
                                 ("所有文件", "*.*")
                             ],
-                            initialfile=f"merged_{len(cropped_images)}regions_w{total_width}xh{max_height}.jpg"
+                            initialfile=f"merged_{len(all_crop_areas)}regions_{len(layouts)}pages.jpg"
                         )
                         
                         if save_path:
-                            # 保存图片
-                            if save_path.lower().endswith('.png'):
-                                merged.save(save_path, format='PNG')
-                            else:
-                                merged.save(save_path, format='JPEG', quality=95)
+                            # 保存图片（多张合成图时文件名追加序号）
+                            root_path, ext = os.path.splitext(save_path)
+                            for page_no, (merged, _, _) in enumerate(pages, 1):
+                                page_path = f"{root_path}_{page_no}{ext}" if len(pages) > 1 else save_path
+                                if save_path.lower().endswith('.png'):
+                                    merged.save(page_path, format='PNG')
+                                else:
+                                    merged.save(page_path, format='JPEG', quality=95)
                             
                             self.progress_label.config(
                                 text=f"✓ 拼接图片已保存到：{os.path.basename(save_path)}"
@@ -6247,27 +8045,29 @@ class OCRApp:
                     
                     # 继续识别流程
                     self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"✓ 已裁剪 {len(cropped_images)} 个区域并拼接\n")
-                    self.result_text.insert(tk.END, f"✓ 拼接尺寸: 宽{total_width} x 高{max_height}\n")
+                    self.result_text.insert(tk.END, f"✓ 已裁剪 {len(all_crop_areas)} 个区域并拼接\n")
+                    mode_name = {'basic': '快速', 'general': '通用', 'accurate': '高精度'}[plan_mode]
+                    self.result_text.insert(tk.END, f"✓ 按{mode_name}识别的尺寸限制装箱，合成图: {len(layouts)} 张（{page_desc}）\n")
                     if user_choice[0] == 'save':
                         self.result_text.insert(tk.END, "="*80 + "\n")
                         self.result_text.insert(tk.END, f"✓ 图片已保存\n")
                     self.result_text.insert(tk.END, "正在识别拼接后的图片，请稍候...\n\n")
                     
-                    self.image_paths = [temp_path]
                     self.file_label.config(
-                        text=f"裁剪拼接图片 ({len(cropped_images)}个区域) - 宽{total_width} x 高{max_height}",
+                        text=f"裁剪拼接图片 ({len(all_crop_areas)}个区域) - {len(layouts)} 张合成图 ({page_desc})",
                         fg="blue"
                     )
                     
-                    # 检查尺寸（宽度和高度都在范围内）
-                    width_in_accurate = self.size_limits["accurate_min_width"] <= total_width <= self.size_limits["accurate_max_width"]
-                    height_in_accurate = self.size_limits["accurate_min_height"] <= max_height <= self.size_limits["accurate_max_height"]
-                    meets_accurate = width_in_accurate and height_in_accurate
+                    # 检查尺寸（每张合成图的宽度和高度都在装箱所用的同一范围内，高精度解锁已计入）
+                    def meets_mode(mode):
+                        min_width, min_height, max_width, max_height = self.mode_size_range(mode)
+                        return all(min_width <= layout['width'] <= max_width and
+                                   min_height <= layout['height'] <= max_height
+                                   for layout in layouts)
                     
-                    width_in_basic = self.size_limits["basic_min_width"] <= total_width <= self.size_limits["basic_max_width"]
-                    height_in_basic = self.size_limits["basic_min_height"] <= max_height <= self.size_limits["basic_max_height"]
-                    meets_basic = width_in_basic and height_in_basic
+                    meets_accurate = meets_mode('accurate')
+                    meets_basic = meets_mode('basic')
+                    meets_general = meets_mode('general')
                     
                     if meets_accurate:
                         self.ocr_btn.config(state=tk.NORMAL)
@@ -6286,14 +8086,14 @@ class OCRApp:
                             f"是否使用高精度识别？\n\n"
                             f"「是」= 高精度识别\n"
                             f"「否」= 快速识别")
-                        if result:
-                            self.root.after(500, self.perform_ocr)
-                        else:
-                            self.root.after(500, self.perform_quick_ocr)
+                        self._start_merged_ocr(pages, 'accurate' if result else 'basic')
                     elif meets_accurate:
-                        self.root.after(500, self.perform_ocr)
+                        self._start_merged_ocr(pages, 'accurate')
                     elif meets_basic:
-                        self.root.after(500, self.perform_quick_ocr)
+                        self._start_merged_ocr(pages, 'basic')
+                    elif meets_general:
+                        self.general_ocr_btn.config(state=tk.NORMAL)
+                        self._start_merged_ocr(pages, 'general')
                 
                 except Exception as e:
                     messagebox.showerror("错误", f"裁剪拼接失败：{str(e)}")
@@ -6329,16 +8129,15 @@ class OCRApp:
                     
                     if display_mode[0] == 'dual' and len(images_data) >= 2:
                         # 双图模式：计算两张图片的总宽度
-                        img1 = images_data[0]['original']
-                        img2 = images_data[1]['original']
+                        (w1, h1), (w2, h2) = images_data[0]['size'], images_data[1]['size']
                         
                         # 获取基础缩放
-                        _, base_scale1 = get_display_image(img1, is_dual_mode=True)
-                        _, base_scale2 = get_display_image(img2, is_dual_mode=True)
+                        base_scale1 = get_base_scale((w1, h1), is_dual_mode=True)
+                        base_scale2 = get_base_scale((w2, h2), is_dual_mode=True)
                         
                         # 计算总宽度（包括间隔）
-                        total_width = img1.width * base_scale1 + 20 + img2.width * base_scale2
-                        max_height = max(img1.height * base_scale1, img2.height * base_scale2)
+                        total_width = w1 * base_scale1 + 20 + w2 * base_scale2
+                        max_height = max(h1 * base_scale1, h2 * base_scale2)
                         
                         # 计算适合屏幕的缩放比例
                         scale_x = canvas_width / total_width
@@ -6348,12 +8147,12 @@ class OCRApp:
                         zoom_level[0] = fit_scale
                     else:
                         # 单图模式
-                        current_img = images_data[current_image_index[0]]['original']
-                        _, base_scale = get_display_image(current_img, is_dual_mode=False)
+                        current_size = images_data[current_image_index[0]]['size']
+                        base_scale = get_base_scale(current_size, is_dual_mode=False)
                         
                         # 计算适合屏幕的缩放比例
-                        img_width = current_img.width * base_scale
-                        img_height = current_img.height * base_scale
+                        img_width = current_size[0] * base_scale
+                        img_height = current_size[1] * base_scale
                         
                         scale_x = canvas_width / img_width
                         scale_y = canvas_height / img_height
@@ -6405,6 +8204,70 @@ class OCRApp:
                 
                 tk.Frame(btn_frame, width=2, bg="gray").pack(side=tk.LEFT, padx=10, fill=tk.Y)
             
+            def save_as_template():
+                """把当前图片的框选区域存为命名模板（相对坐标）"""
+                if display_mode[0] == 'dual' and len(images_data) >= 2:
+                    source = images_data[0] if images_data[0]['crop_areas'] else images_data[1]
+                else:
+                    source = images_data[current_image_index[0]]
+                if not source['crop_areas']:
+                    messagebox.showwarning("警告", "当前图片还没有框选区域！", parent=crop_window)
+                    return
+                name = simpledialog.askstring("保存裁剪模板", "模板名称：", parent=crop_window)
+                if not name:
+                    return
+                regions = template_from_areas([area['coords'] for area in source['crop_areas']], source['size'])
+                self.save_crop_template(name, regions)
+                status_label.config(text=f"✓ 已保存模板「{name}」（{len(regions)} 个区域）", fg="green")
+            
+            def apply_template():
+                """把模板区域按各图片尺寸换算后添加到所有图片"""
+                name = self.choose_crop_template(crop_window)
+                if not name:
+                    return
+                regions = self.store.get('crop_templates', {})[name]
+                for img_data in images_data:
+                    for box in template_to_boxes(regions, img_data['size']):
+                        img_data['crop_areas'].append({'coords': box})
+                display_current_image()
+            
+            def do_roi_ocr():
+                """区域识别：只上传框选区域，识别坐标换算回原图"""
+                regions = [(img_data['path'], area['coords'])
+                           for img_data in images_data for area in img_data['crop_areas']]
+                if not regions:
+                    messagebox.showwarning("警告", "请至少框选一个区域！", parent=crop_window)
+                    return
+                if not API_KEY or not SECRET_KEY:
+                    messagebox.showerror("错误", "请先在 .env 文件中配置 API_KEY 和 SECRET_KEY！", parent=crop_window)
+                    return
+                
+                crop_window.destroy()
+                self.result_text.delete(1.0, tk.END)
+                self.result_text.insert(tk.END, f"正在识别 {len(regions)} 个框选区域，请稍候...\n")
+                self.progress_label.config(text=f"区域识别: {len(regions)} 个区域")
+                self.ocr_btn.config(state=tk.DISABLED)
+                self.quick_ocr_btn.config(state=tk.DISABLED)
+                self.general_ocr_btn.config(state=tk.DISABLED)
+                self.select_btn.config(state=tk.DISABLED)
+                
+                thread = threading.Thread(target=self._roi_ocr_thread, args=(regions,), daemon=True)
+                thread.start()
+            
+            tk.Button(btn_frame, text="🎯 区域识别", command=do_roi_ocr,
+                     bg="#3F51B5", fg="white", font=("Arial", 11),
+                     padx=15, pady=10).pack(side=tk.LEFT, padx=3)
+            
+            tk.Button(btn_frame, text="💾 存为模板", command=save_as_template,
+                     bg="#795548", fg="white", font=("Arial", 11),
+                     padx=15, pady=10).pack(side=tk.LEFT, padx=3)
+            
+            tk.Button(btn_frame, text="📋 套用模板", command=apply_template,
+                     bg="#795548", fg="white", font=("Arial", 11),
+                     padx=15, pady=10).pack(side=tk.LEFT, padx=3)
+            
+            tk.Frame(btn_frame, width=2, bg="gray").pack(side=tk.LEFT, padx=10, fill=tk.Y)
+            
             tk.Button(btn_frame, text="✓ 确认拼接", command=do_crop_and_merge,
                      bg="#4CAF50", fg="white", font=("Arial", 12, "bold"),
                      padx=40, pady=12).pack(side=tk.LEFT, padx=10)